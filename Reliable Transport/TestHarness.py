@@ -1,11 +1,16 @@
 #!/usr/bin/python
+import math
 import os
+import selectors
 import socket
 import subprocess
 import time
 import random
 import util
 from tests import BasicTest, BasicFunctionalityTest, PacketLossTest, DuplicatePacketsTest, OutOfOrderPacketsTest,WindowSizeTest
+from tests import SustainedSendTest, SessionResetTest, ServerResetTest, DelayedPacketsTest
+from tests import StreamBackpressureTest, ClientRegistryTest
+from tests import TimerWheelTest, SackRangesTest, ParityRecoveryTest, SplitPayloadTest
 import signal
 
 def tests_to_run(forwarder):
@@ -14,6 +19,52 @@ def tests_to_run(forwarder):
     DuplicatePacketsTest.DuplicatePacketsTest(forwarder, "DuplicatePackets")
     OutOfOrderPacketsTest.OutOfOrderPacketsTest(forwarder,"OutOfOrderPackets")
     WindowSizeTest.WindowSizeTest(forwarder,'WindowSize')
+    DelayedPacketsTest.DelayedPacketsTest(forwarder, "DelayedPackets")
+
+# checks that drive the transport in this process, without the forwarder
+def checks_to_run():
+    return [TimerWheelTest.TimerWheelTest(TimerWheel),
+            SackRangesTest.SackRangesTest(),
+            ParityRecoveryTest.ParityRecoveryTest(),
+            SplitPayloadTest.SplitPayloadTest(),
+            SustainedSendTest.SustainedSendTest(),
+            SessionResetTest.SessionResetTest(),
+            ServerResetTest.ServerResetTest(),
+            StreamBackpressureTest.StreamBackpressureTest(),
+            ClientRegistryTest.ClientRegistryTest()]
+
+class TimerWheel(object):
+    # Hashed timer wheel: an item due at time t goes in the slot of the tick
+    # ceil(t / resolution), so scheduling is O(1) and expiring only looks at the
+    # slots of the ticks that have passed. Items more than a turn ahead stay
+    # in their slot until their own tick comes round.
+    def __init__(self, resolution, slots=512):
+        self.resolution = resolution
+        self.slots = [[] for _ in range(slots)]
+        self.current = int(time.time() / resolution)
+        self.count = 0
+
+    def schedule(self, due, item):
+        tick = max(math.ceil(due / self.resolution), self.current)
+        self.slots[tick % len(self.slots)].append((tick, item))
+        self.count += 1
+
+    def expire(self, now):
+        target = int(now / self.resolution)
+        ready = []
+        if self.count:
+            last = min(target, self.current + len(self.slots) - 1)
+            for tick in range(self.current, last + 1):
+                slot = self.slots[tick % len(self.slots)]
+                if slot:
+                    ready.extend(item for due, item in slot if due <= target)
+                    slot[:] = [(due, item) for due, item in slot if due > target]
+            self.count -= len(ready)
+        # the slot of the current tick is looked at again, for the items
+        # scheduled later in the same tick
+        self.current = max(self.current, target)
+        return ready
+
 class Forwarder(object):
     def __init__(self, sender_path, receiver_path, port):
         if not os.path.exists(sender_path):
@@ -31,6 +82,7 @@ class Forwarder(object):
         self.tick_interval = 0.001 # 1ms
         self.last_tick = time.time()
         self.timeout = 60. # seconds
+        self.delayed = TimerWheel(self.tick_interval) # packets held back by delay()
 
         # network stuff
         self.port = port
@@ -43,14 +95,23 @@ class Forwarder(object):
 
     def _tick(self):
         self.current_test.handle_tick(self.tick_interval)
+        self._flush()
+
+    def _flush(self):
         for p , user in self.out_queue:
             self._send(p, user)
         self.out_queue = []
+        for p, user in self.delayed.expire(time.time()):
+            self._send(p, user)
 
     def _send(self, packet, user):
         packet.update_packet(seqno=packet.seqno, update_checksum=False)
         self.middle[user].sendto(packet.full_packet, packet.address)
 
+    def delay(self, packet, user, seconds):
+        # for tests: forward a packet seconds from now instead of right away
+        self.delayed.schedule(time.time() + seconds, (packet, user))
+
     def register_test(self, testcase, testName):
         assert isinstance(testcase, BasicTest.BasicTest)
         self.tests[testcase] = testName
@@ -63,7 +124,7 @@ class Forwarder(object):
             i = 0
             for client in sorted(self.current_test.client_stdin.keys()):
                 self.middle[client] = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-                self.middle[client].settimeout(0.01) # make this a very short timeout
+                self.middle[client].setblocking(False)
                 self.middle[client].bind(('', self.port-i))
                 self.cli_ports[client] = self.port - i
                 i += 1
@@ -82,6 +143,16 @@ class Forwarder(object):
         # print(p.full_packet)
         self.current_test.handle_packet()
         
+    def _receive_all(self, sock, user):
+        while True:
+            try:
+                message, address = sock.recvfrom(4096)
+            except (BlockingIOError, InterruptedError):
+                return
+            except ConnectionRefusedError:
+                continue
+            self.handle_receive(message, address, user)
+
     def start(self):
         self.sender_addr = {}
         self.receiver_addr = ('127.0.0.1', self.receiver_port)
@@ -98,25 +169,29 @@ class Forwarder(object):
             self.senders[i] = subprocess.Popen(["python3", self.sender_path,
                                    "-p", str(self.cli_ports[i]),
                                    "-u", i], stdin=subprocess.PIPE, stdout=sender_out[i])
+        # wake up as soon as any client's socket has a packet, and forward it
+        # straight away instead of on the next tick
+        selector = selectors.DefaultSelector()
+        for i in self.middle:
+            selector.register(self.middle[i], selectors.EVENT_READ, i)
         try:
             start_time = time.time()
             self.last_tick = time.time()
             while None in [self.senders[s].poll() for s in self.senders]:
-                for i in list(self.middle.keys()):
-                    try:
-                        message, address = self.middle[i].recvfrom(4096)
-                        self.handle_receive(message, address, i)
-                    except socket.timeout:
-                        pass
-                    if time.time() - self.last_tick > self.tick_interval:
-                        self.last_tick = time.time()
-                        self._tick()
-                    if time.time() - start_time > self.timeout:
-                        raise Exception("Test timed out!")
+                timeout = self.last_tick + self.tick_interval - time.time()
+                for key, _ in selector.select(max(timeout, 0)):
+                    self._receive_all(key.fileobj, key.data)
+                self._flush()
+                if time.time() - self.last_tick > self.tick_interval:
+                    self.last_tick = time.time()
+                    self._tick()
+                if time.time() - start_time > self.timeout:
+                    raise Exception("Test timed out!")
             self._tick()
         except (KeyboardInterrupt, SystemExit):
             exit()
         finally:
+            selector.close()
             for sender in self.senders:
                 if self.senders[sender].poll() is None:
                     self.senders[sender].send_signal(signal.SIGINT)
@@ -216,6 +291,8 @@ if __name__ == "__main__":
         elif o in ("-s", "--server"):
             receiver = a
 
+    for check in checks_to_run():
+        check.run()
     f = Forwarder(sender, receiver, port)
     tests_to_run(f)
     f.execute_tests()
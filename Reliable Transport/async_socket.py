@@ -0,0 +1,786 @@
+import asyncio
+import json
+import socket
+import time
+from typing import Callable, Dict, Tuple, Union
+from reliable_transport import ReliableMessageSender, ReliableMessageReceiver, \
+    ReliableSessionSender, ReliableStreamSender
+from stream import StreamReader
+from batch_io import DatagramReader, Outbox
+from compression import check_method as check_compression
+from flow_control import ReceiveWindow
+from dispatch import PeerTable
+from rtt_estimator import RttEstimator
+from congestion_control import CongestionController
+from pacing import Pacer
+import codec as wire
+import util
+
+Address = Tuple[str, int]
+MsgID = int
+Message = Union[str, bytes]
+
+
+class _CompletedMessage:
+    '''
+    Stands in for the completed message queue of a ReliableMessageReceiver:
+    instead of needing a thread to wait on it, put hands the message over to
+    the socket straight away.
+    '''
+
+    def __init__(self, deliver: Callable[[Message, Tuple[Address, MsgID]], None],
+                 key: Tuple[Address, MsgID]):
+        self.deliver = deliver
+        self.key = key
+
+    def put(self, message: Message):
+        self.deliver(message, self.key)
+
+
+class AsyncReliableSocket:
+    """
+    A socket that reliably transports messages, driven by an asyncio event loop.
+
+    Description:
+        This is the engine behind ReliableSocket. All the senders, receivers
+        and retransmission timers of the socket are multiplexed on the one
+        event loop it is created in: packets are read when the UDP socket
+        becomes readable and handed to their ReliableMessageSender or
+        ReliableMessageReceiver, and each sender has a single timer that fires
+        at its retransmission deadline. No thread is started, however many
+        messages are in progress.
+
+        Senders and receivers are found through a PeerTable (see
+        dispatch.py), sharded by peer address, which also holds what is
+        learnt about the path to each peer. Only the event loop touches it;
+        ReliableSocket hands every call over to the loop instead of sharing
+        it with other threads. The packets of a peer are handled in the order
+        they arrive.
+
+        Packets are read in batches of util.IO_BATCH_SIZE per wakeup of the
+        loop, and the packets sent while a batch (or a timeout) is handled go
+        out together once it is done; see batch_io.py. With delayed_acks, the
+        ACK a receiver holds back is sent at the end of the batch, so ACKs
+        are only delayed while more packets are already waiting.
+
+        With pacing or a rate limit, the data packets to a peer are let out
+        by its Pacer (see pacing.py), and a sender whose packets are held
+        back is woken up by its timer when the pacer lets them out.
+
+        The socket has to be created from a coroutine (or a callback) running
+        in the event loop that will drive it.
+
+    APIs:
+        await AsyncReliableSocket.sendto(receiver_addr, message)
+            Sends a message to an address
+        await AsyncReliableSocket.recvfrom()
+            Receives a message sent to the socket
+        await AsyncReliableSocket.send_stream(receiver_addr, source)
+            Sends a file or an iterable of pieces to an address as one message
+        await AsyncReliableSocket.recv_stream()
+            Receives a stream sent to the socket as it arrives
+        AsyncReliableSocket.release(message)
+            Frees the receive buffer space of a message handed to on_message
+        AsyncReliableSocket.stats()
+            Counts the messages the socket keeps state for
+        AsyncReliableSocket.metrics()
+            Reports the RTT, retransmissions and goodput of every peer
+        AsyncReliableSocket.close()
+            Stops reading from and closes the UDP socket
+
+    Lifecycle:
+        The sender and receiver of a message are kept for linger seconds
+        after the message is done, like a TCP connection in TIME_WAIT: the
+        receiver keeps acknowledging a retransmitted end packet whose ACK was
+        lost, and the message id is not reused for the same peer while the
+        other side may still hold its receiver. The ids of a peer are taken
+        in turn from util.MIN_MSG_ID to util.MAX_MSG_ID; when they are all
+        held by lingering senders, sendto waits for the sweep to free some.
+        A receiver that sees no
+        packets for util.IDLE_TIME_OUT seconds before its message is complete
+        belongs to a sender that gave up, and is dropped. Both are removed by
+        a sweep that runs every linger / 2 seconds, so the state of a busy
+        socket stays proportional to the messages of the last linger seconds.
+        A peer that has had no message for util.IDLE_TIME_OUT seconds is
+        forgotten as well, with its RTT estimate and congestion window.
+
+        A receiver that gets the data of a message it has no state for, its
+        socket having been restarted or having dropped it, answers with a
+        reset. The message is then sent again from its start packet, and the
+        messages a session had not delivered are pushed again in a new
+        session; a stream, or a message whose data had all been
+        acknowledged, fails with ConnectionResetError instead.
+
+    Options:
+        selective_repeat, congestion_control, wire_format, max_in_flight,
+        sessions, max_datagram_size, probe_mtu, fec, compression,
+        delayed_acks, receive_buffer, pacing and rate_limits are the same as
+        for ReliableSocket.
+        on_message (callable):
+            Called with (message, address) for every completely received
+            message instead of queueing it for recvfrom. With a
+            receive_buffer, release has to be called with every message once
+            it has been read. Defaults to None.
+        metrics_file and metrics_interval are the same as for ReliableSocket.
+        on_stream (callable):
+            Called with (StreamReader, address) for every stream as soon as it
+            starts instead of queueing it for recv_stream. Defaults to None.
+        linger (float):
+            Seconds a finished message is remembered for (see Lifecycle).
+            Defaults to util.LINGER_TIME.
+    """
+    def __init__(self, dest, port, window_size, bufsize=4096,
+                 selective_repeat=False, congestion_control=True,
+                 wire_format="text", max_in_flight=util.MAX_IN_FLIGHT_MESSAGES,
+                 sessions=False, max_datagram_size=util.MAX_DATAGRAM_SIZE,
+                 probe_mtu=False, fec=0, compression=None, delayed_acks=False,
+                 receive_buffer=None, pacing=False, rate_limits=None,
+                 metrics_file=None, metrics_interval=util.METRICS_INTERVAL,
+                 on_message=None, on_stream=None, linger=util.LINGER_TIME):
+        self.__window_size = window_size
+        self.__fec = fec
+        self.__compression = None if compression is None else \
+            check_compression(compression)
+        self.__delayed_acks = delayed_acks
+        self.__receive_window = None if receive_buffer is None else \
+            ReceiveWindow(receive_buffer)
+        # the receivers that advertised a closed window
+        self.__closed_windows = set()
+        self.__pacing = pacing
+        self.__rate_limits: Dict[Address, float] = dict(rate_limits or {})
+        self.__use_sessions = sessions
+        self.__max_datagram_size = max_datagram_size
+        self.__probe_mtu = probe_mtu
+        self.__selective_repeat = selective_repeat
+        self.__congestion_control = congestion_control
+        self.__codec = wire.get_codec(wire_format)
+        self.__bufsize = bufsize
+        self.__loop = asyncio.get_running_loop()
+        self.__sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.__sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.__sock.setblocking(False)
+        self.__sock.bind((dest, port))
+        self.__reader = DatagramReader(self.__sock, bufsize)
+        # what the senders and receivers send through
+        self.__outbox = Outbox(self.__sock)
+
+        # the senders and receivers of every peer, and what is learnt about
+        # the path to it and shared by all the messages sent to it
+        self.__peers = PeerTable()
+        # the receivers holding back an ACK until the current batch is handled
+        self.__acks_held = set()
+
+        # the completion future and (timer, due time) of every sender
+        self.__completions: Dict[Tuple[Address, MsgID], asyncio.Future] = {}
+        self.__timers: Dict[Tuple[Address, MsgID], Tuple[asyncio.TimerHandle, float]] = {}
+
+        # when each sender finished and each receiver last got a packet
+        self.__finished: Dict[Tuple[Address, MsgID], float] = {}
+        self.__last_seen: Dict[Tuple[Address, MsgID], float] = {}
+        self.__linger = linger
+        self.__retired = {"senders": 0, "receivers": 0, "expired_receivers": 0,
+                          "peers": 0}
+
+        # set, and replaced, whenever the sweep retires senders and frees
+        # their message ids
+        self.__senders_retired = asyncio.Event()
+
+        # sendto calls beyond max_in_flight wait here for a free slot
+        self.__in_flight = asyncio.Semaphore(max_in_flight)
+
+        self.__on_message = on_message
+        self.__received_messages: asyncio.Queue = asyncio.Queue()
+        self.__on_stream = on_stream
+        self.__received_streams: asyncio.Queue = asyncio.Queue()
+
+        self.__loop.add_reader(self.__sock.fileno(), self.__receive_handler)
+        self.__sweeper = self.__loop.call_later(linger / 2, self.__sweep)
+
+        self.__metrics_file = metrics_file
+        self.__metrics_interval = metrics_interval
+        self.__metrics_dumper = None
+        if metrics_file is not None:
+            self.__metrics_dumper = self.__loop.call_later(metrics_interval,
+                                                           self.__dump_metrics)
+
+    def getsockname(self) -> Address:
+        return self.__sock.getsockname()
+
+    async def recvfrom(self) -> Tuple[Message, Address]:
+        """
+        Returns a reliably received message on the socket, waiting for one if
+        necessary.
+
+        Returns:
+            Tuple[Union[str, bytes], Address]:
+                A tuple of
+                    (i)  the received message (bytes if it was sent as bytes), and
+                    (ii) the address from where the message is received from
+        """
+
+        message, sender_addr = await self.__received_messages.get()
+        self.release(message)
+        return message, sender_addr
+
+    async def recv_stream(self) -> Tuple[StreamReader, Address]:
+        """
+        Returns a stream sent to the socket as soon as it starts, waiting for
+        one if necessary.
+
+        Returns:
+            Tuple[StreamReader, Address]:
+                A tuple of
+                    (i)  the reader the chunks of the stream are read from, and
+                    (ii) the address from where the stream is received from
+        """
+
+        return await self.__received_streams.get()
+
+    async def send_stream(self, receiver_addr: Address, source):
+        """
+        Send a stream to an address reliably.
+
+        Args:
+            receiver_addr (Address): Address of destination
+            source: A file-like object (anything with a read method) or an
+                iterable of str or bytes pieces. bytes need the binary wire
+                format.
+
+        Note:
+            Returns once the whole stream has been reliably transported to the
+            destination. The source is read as the window opens, so only the
+            packets in flight are held in memory. Reading it blocks the event
+            loop, so it should be a local file or an iterator that is quick to
+            produce its pieces. The receiving side reads it with recv_stream,
+            not recvfrom.
+        """
+
+        async with self.__in_flight:
+            await self.__send_message_reliably(receiver_addr, source,
+                                               ReliableStreamSender)
+
+    async def sendto(self, receiver_addr: Address, message: Message):
+        """
+        Send message to an address reliably.
+
+        Args:
+            receiver_addr (Address): Address of destination
+            message (str or bytes): Message to send to the destination. bytes
+                messages need the binary wire format.
+
+        Note:
+            Returns once the message has been reliably transported to the
+            destination. Any number of sendto calls may be awaited at once;
+            at most max_in_flight of them are sent at the same time and the
+            rest wait for their turn. Messages sent at the same time to the
+            same address may arrive in any order, unless sessions are used.
+            Raises ConnectionResetError if the receiver forgot the message
+            once all of its data was acknowledged (see Lifecycle).
+        """
+
+        async with self.__in_flight:
+            if self.__use_sessions:
+                await self.__send_in_session(receiver_addr, message)
+            else:
+                await self.__send_message_reliably(receiver_addr, message)
+
+    async def __send_message_reliably(self, receiver_addr: Address, message: Message,
+                                      sender_class=ReliableMessageSender):
+        """
+        Sends a message reliably.
+        - Initializes a reliable message sender instance that can reliably send this message.
+        - Stores this in a dictionary so that we can send acks to it from our receive_handler.
+        - Notifies the reliable message sender to start sending.
+        - Waits until its ACKs have made it reach the end of the message.
+        """
+
+        msg_id = await self.__get_unique_msg_id(receiver_addr)
+        key = (receiver_addr, msg_id)
+
+        sender = sender_class(self.__outbox, receiver_addr, msg_id,
+                              self.__window_size,
+                              self.__get_rtt_estimator(receiver_addr),
+                              self.__selective_repeat,
+                              self.__get_congestion_controller(receiver_addr),
+                              self.__codec,
+                              self.__get_datagram_size(receiver_addr),
+                              self.__fec, self.__compression,
+                              self.__get_pacer(receiver_addr),
+                              self.__peers.peer(receiver_addr).metrics)
+
+        completion = self.__loop.create_future()
+        self.__peers.peer(receiver_addr).senders[msg_id] = sender
+        self.__completions[key] = completion
+
+        sender.metrics.on_send_started()
+        delivered = None
+        try:
+            sender.begin(message)
+            self.__schedule(key, sender)
+            await completion
+            delivered = sender.length
+        finally:
+            sender.metrics.on_send_finished(delivered)
+            self.__on_sender_finished(key)
+
+    async def __send_in_session(self, receiver_addr: Address, message: Message):
+        """
+        Sends a message reliably in the session to its address, opening a
+        new session if there is none or the last one is being closed.
+        """
+
+        delivered = self.__loop.create_future()
+        metrics = self.__peers.peer(receiver_addr).metrics
+        metrics.on_send_started()
+        size = None
+        try:
+            await self.__push_in_session(receiver_addr, message,
+                                         lambda: delivered.done() or delivered.set_result(None))
+            await delivered
+            size = len(message)
+        finally:
+            metrics.on_send_finished(size)
+
+    async def __push_in_session(self, receiver_addr: Address, message: Message,
+                                on_delivered: Callable[[], None]):
+        """
+        Queues a message in the session to its address, opening a new session
+        if there is none or the last one is being closed. on_delivered is
+        called once the message is delivered.
+        """
+
+        session = self.__peers.peer(receiver_addr).session
+        if session is None or session.closing:
+            msg_id = await self.__get_unique_msg_id(receiver_addr)
+            # another sendto may have opened one in the meantime
+            session = self.__peers.peer(receiver_addr).session
+            if session is None or session.closing:
+                session = self.__open_session(receiver_addr, msg_id)
+
+        session.push(message, on_delivered)
+        self.__schedule((receiver_addr, session.msg_id), session)
+
+    async def __push_again(self, receiver_addr: Address, undelivered):
+        """
+        Queues the messages a reset session did not deliver, as
+        (message, on_delivered), in a new session, in the order they were
+        first pushed.
+        """
+
+        for message, on_delivered in undelivered:
+            await self.__push_in_session(receiver_addr, message, on_delivered)
+
+    def __open_session(self, receiver_addr: Address, msg_id: int) -> ReliableSessionSender:
+        """
+        Starts a session to an address, as message msg_id. The session sender
+        is handled like any other sender, except that it is only done once
+        the session has been closed for being idle, or reset by a receiver
+        that lost its state; the messages a reset session did not deliver
+        are pushed again in a new one.
+        """
+
+        key = (receiver_addr, msg_id)
+
+        session = ReliableSessionSender(self.__outbox, receiver_addr, msg_id,
+                                        self.__window_size,
+                                        self.__get_rtt_estimator(receiver_addr),
+                                        self.__selective_repeat,
+                                        self.__get_congestion_controller(receiver_addr),
+                                        self.__codec,
+                                        self.__get_datagram_size(receiver_addr),
+                                        self.__fec,
+                                        self.__get_pacer(receiver_addr),
+                                        self.__peers.peer(receiver_addr).metrics)
+
+        completion = self.__loop.create_future()
+        peer = self.__peers.peer(receiver_addr)
+        peer.senders[msg_id] = session
+        peer.session = session
+        self.__completions[key] = completion
+        session.open()
+        self.__schedule(key, session)
+
+        def on_closed(_):
+            if peer.session is session:
+                peer.session = None
+            self.__on_sender_finished(key)
+            if session.undelivered:
+                self.__loop.create_task(self.__push_again(receiver_addr,
+                                                          session.undelivered))
+
+        completion.add_done_callback(on_closed)
+        return session
+
+    def __on_sender_finished(self, key):
+        """
+        Stops the timer of a sender that is done and lets it linger.
+        """
+
+        timer = self.__timers.pop(key, None)
+        if timer is not None:
+            timer[0].cancel()
+        del self.__completions[key]
+        # the sender is deleted by __sweep once it has lingered
+        self.__finished[key] = time.time()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Counts the messages the socket keeps state for.
+
+        Returns:
+            Dict[str, int]:
+                sending / receiving: messages in progress,
+                lingering_senders / lingering_receivers: finished messages
+                    kept for late duplicates,
+                retired_senders / retired_receivers: finished messages
+                    deleted so far,
+                expired_receivers: unfinished messages dropped after
+                    util.IDLE_TIME_OUT seconds without packets,
+                peers: addresses the socket keeps state for,
+                forgotten_peers: addresses forgotten after util.IDLE_TIME_OUT
+                    seconds without messages.
+        """
+
+        receivers = completed = 0
+        for peer in self.__peers:
+            receivers += len(peer.receivers)
+            completed += sum(1 for receiver in peer.receivers.values()
+                             if receiver.completed)
+        return {
+            "sending": len(self.__completions),
+            "lingering_senders": len(self.__finished),
+            "receiving": receivers - completed,
+            "lingering_receivers": completed,
+            "retired_senders": self.__retired["senders"],
+            "retired_receivers": self.__retired["receivers"],
+            "expired_receivers": self.__retired["expired_receivers"],
+            "peers": len(self.__peers),
+            "forgotten_peers": self.__retired["peers"],
+        }
+
+    def metrics(self) -> Dict[Address, Dict[str, object]]:
+        """
+        Reports what happened to the messages exchanged with every peer the
+        socket keeps state for (see metrics.py). A peer's counters go when
+        the peer is forgotten (see Lifecycle).
+
+        Returns:
+            Dict[Address, Dict[str, object]]:
+                For every peer address:
+                rtt: the count, mean, min, p50, p90, p99 and max of the RTT
+                    samples in seconds, and their histogram as
+                    [upper bound, count] buckets,
+                packets_sent / retransmissions: packets sent, and sent again,
+                timeouts / fast_retransmits / duplicate_acks: what triggered
+                    the retransmissions,
+                messages_sent / bytes_sent: messages delivered, and their
+                    length in characters (bytes of bytes messages),
+                bytes_in_flight: bytes of data packets sent and not
+                    acknowledged yet, headers included,
+                goodput: bytes_sent per second spent sending, or None,
+                packets_received / duplicate_packets: packets received, and
+                    data packets received more than once,
+                messages_received / bytes_received: messages (and streams)
+                    received, and the bytes of data taken for them.
+        """
+
+        return {peer.address: peer.metrics.snapshot(
+                    sum(sender.bytes_in_flight() for sender in peer.senders.values()))
+                for peer in self.__peers}
+
+    def __dump_metrics(self):
+        """
+        Appends the metrics of the socket to metrics_file as a line of JSON,
+        with the time and every peer as "host:port".
+        """
+
+        line = {"time": time.time(),
+                "peers": {"%s:%d" % address: metrics
+                          for address, metrics in self.metrics().items()}}
+        with open(self.__metrics_file, "a") as file:
+            file.write(json.dumps(line) + "\n")
+        self.__metrics_dumper = self.__loop.call_later(self.__metrics_interval,
+                                                       self.__dump_metrics)
+
+    def close(self):
+        """
+        Stops receiving packets and closes the UDP socket. Messages still
+        being sent are abandoned.
+        """
+
+        self.__loop.remove_reader(self.__sock.fileno())
+        self.__sweeper.cancel()
+        if self.__metrics_dumper is not None:
+            self.__metrics_dumper.cancel()
+        for timer, _ in self.__timers.values():
+            timer.cancel()
+        self.__timers.clear()
+        self.__sock.close()
+
+    @staticmethod
+    def __is_from_a_receiver(sender_type: str) -> bool:
+        return sender_type == wire.RECEIVER
+
+    def __receive_handler(self):
+        """
+        Reads a batch of the packets waiting on the socket and redirects them
+        to the their particular reliable message sender/receivers. The loop
+        calls it again as long as packets are waiting.
+        """
+
+        batch = self.__reader.read_batch()
+        self.__outbox.cork()
+        try:
+            for byte_packet, addr in batch:
+                self.__handle_packet(byte_packet, addr)
+            while self.__acks_held:
+                self.__acks_held.pop().flush_ack()
+        finally:
+            self.__outbox.flush()
+
+    def __handle_packet(self, byte_packet: bytes, addr):
+        """
+        Redirects a packet to its reliable message sender/receiver.
+        """
+
+        codec = wire.detect(byte_packet)
+        decoded = codec.decode(byte_packet)
+        if decoded is None:
+            # malformed or corrupted beyond finding its message
+            return
+        sender_type, msg_id, packet = decoded
+
+        if self.__is_from_a_receiver(sender_type):
+            # this belongs to a sender
+            self.__send_to_a_sender(addr, msg_id, packet)
+        else:
+            # this belongs to a receiver
+            self.__send_to_a_receiver(addr, msg_id, packet, codec)
+
+    def __send_to_a_sender(self, addr, msg_id: int, ack_packet):
+        """
+        Redirects received ack packet to the corresponding message sender
+        """
+
+        key = (addr, msg_id)
+        sender: ReliableMessageSender = self.__peers.sender(addr, msg_id)
+        if key not in self.__completions:
+            if sender is None:
+                print("Warning: no sender identified for", key)
+            return
+
+        ack = sender.parse_ack(ack_packet)
+        if ack is None:
+            return
+        sender.on_ack(*ack)
+        self.__schedule(key, sender)
+
+    def __send_to_a_receiver(self, addr, msg_id: int, packet, codec):
+        """
+        Redirects received packet to the corresponding message receiver.
+        If no such receiver is found, a new message receiver is initialized.
+        """
+
+        key = (addr, msg_id)
+        receiver: ReliableMessageReceiver = self.__peers.receiver(addr, msg_id)
+        if receiver is None:
+            # this is a new transmission, set up new receiver
+            receiver = ReliableMessageReceiver(
+                self.__outbox, addr, msg_id,
+                _CompletedMessage(self.__deliver, key), codec,
+                self.__delayed_acks, self.__receive_window,
+                self.__peers.peer(addr).metrics)
+            self.__peers.peer(addr).receivers[msg_id] = receiver
+
+        self.__last_seen[key] = time.time()
+        receiver.on_packet_received(packet)
+        if receiver.unacked:
+            self.__acks_held.add(receiver)
+        if receiver.advertised == 0:
+            self.__closed_windows.add(receiver)
+
+    def release(self, message: Message):
+        """
+        Frees the space a message took up in the receive buffer, once it has
+        been read. recvfrom does this itself; with on_message, it has to be
+        called for every message handed to it.
+
+        Args:
+            message (str or bytes): A message handed to on_message
+        """
+
+        if self.__receive_window is None:
+            return
+        self.__receive_window.release_unread(len(message))
+        if self.__receive_window.window() >= self.__max_datagram_size:
+            # tell the senders held back by a closed window that it is open
+            for receiver in self.__closed_windows:
+                if receiver.buffer is not None:
+                    receiver.send_ack()
+            self.__closed_windows.clear()
+
+    def __deliver(self, message: Message, key: Tuple[Address, MsgID]):
+        """
+        Acts on a completely received message, or a stream that has started.
+        """
+
+        sender_addr, _ = key
+        self.__peers.peer(sender_addr).metrics.messages_received += 1
+
+        if self.__receive_window is not None and \
+                not isinstance(message, StreamReader):
+            # unread, the message takes up the space its chunks did
+            self.__receive_window.hold_unread(len(message))
+
+        if isinstance(message, StreamReader):
+            if self.__on_stream is not None:
+                self.__on_stream(message, sender_addr)
+            else:
+                self.__received_streams.put_nowait((message, sender_addr))
+        elif self.__on_message is not None:
+            self.__on_message(message, sender_addr)
+        else:
+            self.__received_messages.put_nowait((message, sender_addr))
+
+    def __schedule(self, key, sender: ReliableMessageSender):
+        """
+        Completes the sendto of a finished sender, or makes sure its timer
+        fires no later than its next_timer(): its retransmission deadline, or
+        when its pacer lets its next packet out. A timer that is due after
+        that is replaced; one that is due before it simply checks again when
+        it fires, so that the many ACKs that push the deadline back do not
+        each reschedule the timer.
+        """
+
+        completion = self.__completions.get(key)
+        if completion is None:
+            return
+
+        if sender.done:
+            if not completion.done():
+                if sender.error is not None:
+                    completion.set_exception(sender.error)
+                else:
+                    completion.set_result(None)
+            return
+
+        due = sender.next_timer()
+        timer = self.__timers.get(key)
+        if timer is not None:
+            if timer[1] <= due:
+                return
+            timer[0].cancel()
+
+        delay = max(0, due - time.time())
+        handle = self.__loop.call_later(delay, self.__on_timer, key)
+        self.__timers[key] = (handle, due)
+
+    def __on_timer(self, key):
+        """
+        Retransmits for a sender whose deadline has passed, or sends the
+        packets its pacer held back.
+        """
+
+        del self.__timers[key]
+        sender: ReliableMessageSender = self.__peers.sender(*key)
+        if time.time() >= sender.next_timer():
+            self.__outbox.cork()
+            try:
+                sender.on_timer()
+            finally:
+                self.__outbox.flush()
+        self.__schedule(key, sender)
+
+    def __sweep(self):
+        """
+        Deletes the senders and receivers of messages that have lingered for
+        long enough, the receivers of messages that were abandoned, and the
+        peers that have had no message for util.IDLE_TIME_OUT seconds.
+        """
+
+        now = time.time()
+        retired = [key for key, finished in self.__finished.items()
+                   if now - finished >= self.__linger]
+        for key in retired:
+            addr, msg_id = key
+            del self.__finished[key]
+            del self.__peers.get(addr).senders[msg_id]
+            self.__retired["senders"] += 1
+        if retired:
+            self.__senders_retired.set()
+            self.__senders_retired = asyncio.Event()
+
+        for key, last_seen in list(self.__last_seen.items()):
+            addr, msg_id = key
+            receivers = self.__peers.get(addr).receivers
+            receiver: ReliableMessageReceiver = receivers[msg_id]
+            if receiver.completed and now - last_seen >= self.__linger:
+                self.__retired["receivers"] += 1
+            elif not receiver.completed and now - last_seen >= util.IDLE_TIME_OUT:
+                self.__retired["expired_receivers"] += 1
+                receiver.release_held()
+            else:
+                continue
+            self.__closed_windows.discard(receiver)
+            del self.__last_seen[key]
+            del receivers[msg_id]
+
+        self.__retired["peers"] += self.__peers.forget_idle(util.IDLE_TIME_OUT)
+
+        self.__sweeper = self.__loop.call_later(self.__linger / 2, self.__sweep)
+
+    async def __get_unique_msg_id(self, recvr_addr) -> int:
+        """
+        Returns a message id that no sender to an address has, waiting for
+        the sweep to retire finished senders if they hold every id.
+        """
+        while True:
+            msg_id = self.__peers.peer(recvr_addr).new_msg_id()
+            if msg_id is not None:
+                return msg_id
+            await self.__senders_retired.wait()
+
+    def __get_rtt_estimator(self, recvr_addr) -> RttEstimator:
+        """
+        Returns the RTT estimator of a peer.
+        """
+        return self.__peers.peer(recvr_addr).rtt_estimator
+
+    def __get_congestion_controller(self, recvr_addr) -> CongestionController:
+        """
+        Returns the congestion controller of a peer, creating it on first use,
+        or None if congestion control is turned off.
+        """
+        if not self.__congestion_control:
+            return None
+        peer = self.__peers.peer(recvr_addr)
+        if peer.congestion is None:
+            peer.congestion = CongestionController(self.__window_size)
+        return peer.congestion
+
+    def __get_pacer(self, recvr_addr) -> Pacer:
+        """
+        Returns the pacer of a peer, creating it on first use, or None if
+        packets to the peer are neither paced nor rate limited.
+        """
+        rate_limit = self.__rate_limits.get(recvr_addr)
+        if not self.__pacing and rate_limit is None:
+            return None
+        peer = self.__peers.peer(recvr_addr)
+        if peer.pacer is None:
+            peer.pacer = Pacer(peer.rtt_estimator, self.__pacing, rate_limit)
+        return peer.pacer
+
+    def __get_datagram_size(self, recvr_addr) -> int:
+        """
+        Returns the largest datagram to send to a peer: max_datagram_size,
+        or less if probe_mtu is set and the path MTU to the peer is smaller.
+        The path is probed once per peer.
+        """
+        if not self.__probe_mtu:
+            return self.__max_datagram_size
+        peer = self.__peers.peer(recvr_addr)
+        if peer.datagram_size is None:
+            peer.datagram_size = wire.probe_datagram_size(
+                recvr_addr, self.__max_datagram_size)
+        return peer.datagram_size
@@ -0,0 +1,89 @@
+'''
+This module batches the UDP I/O of a socket. CPython has no sendmmsg or
+recvmmsg, so every datagram still takes a system call, but the datagrams are
+handled a batch at a time:
+
+- DatagramReader reads up to a batch of the datagrams waiting on the socket
+  per wakeup of the event loop. Between batches the loop runs its other
+  callbacks, so that a flood of packets cannot hold back the retransmission
+  timers.
+- Outbox queues the datagrams sent while a batch of packets (or a timeout) is
+  handled and sends them together at the end, so that the ACKs of a batch
+  release the whole window in one go after all of them have been processed.
+
+Reading into preallocated buffers with recvmsg_into or recvfrom_into was
+measured to be slower than recvfrom (2.2 and 1.9 against 1.7 microseconds per
+1400 byte datagram): allocating the bytes of a datagram is cheaper than the
+extra arguments and the copy a reused buffer needs before its payload can be
+kept.
+'''
+import socket
+from typing import List, Tuple
+import util
+import codec as wire
+
+Address = Tuple[str, int]
+
+
+class DatagramReader:
+    '''
+    Reads the datagrams waiting on a non-blocking socket, up to batch_size
+    at a time.
+    '''
+
+    def __init__(self, sock: socket.socket, bufsize: int,
+                 batch_size: int = util.IO_BATCH_SIZE):
+        self.sock = sock
+        self.bufsize = bufsize
+        self.batch_size = batch_size
+
+    def read_batch(self) -> List[Tuple[bytes, Address]]:
+        '''
+        Returns the datagrams read as (datagram, address) pairs.
+        '''
+        batch = []
+        recvfrom = self.sock.recvfrom
+        for _ in range(self.batch_size):
+            try:
+                batch.append(recvfrom(self.bufsize))
+            except (BlockingIOError, InterruptedError):
+                break
+            except ConnectionError:
+                # an ICMP error for an earlier datagram; the datagram is lost
+                continue
+        return batch
+
+
+class Outbox:
+    '''
+    Stands in for the socket of the senders and receivers of a socket (it is
+    what they pass to codec.send_datagram). Datagrams are sent straight away,
+    except between cork and flush, when they are queued and then sent
+    together.
+    '''
+
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self.queue = []
+        self.corked = False
+
+    def sendmsg(self, buffers: wire.Datagram, ancdata=(), flags=0, address=None):
+        if self.corked:
+            self.queue.append((buffers, address))
+        else:
+            wire.send_datagram(self.sock, buffers, address)
+
+    def cork(self):
+        '''
+        Queues the datagrams sent from now on until flush.
+        '''
+        self.corked = True
+
+    def flush(self):
+        '''
+        Sends the queued datagrams, in the order they were sent.
+        '''
+        self.corked = False
+        queue, self.queue = self.queue, []
+        for buffers, address in queue:
+            wire.send_datagram(self.sock, buffers, address)
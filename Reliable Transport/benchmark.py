@@ -0,0 +1,140 @@
+'''
+This script measures how long the reliable transport takes to deliver a
+message through an emulated link (see link_emulator.py), for every window
+size and loss rate asked for:
+
+    python3 benchmark.py [-s SIZE] [-w WINDOWS] [-l LOSSES] [-d DELAY]
+                         [-b BANDWIDTH] [-r REPEAT] [-o OPTION=VALUE]...
+
+Every run sends one message of SIZE characters from one AsyncReliableSocket
+to another, both in this process, and times it from sendto until the
+receiver has the whole message. The runs of a cell use the seeds 0 to
+REPEAT - 1, so the same datagrams are lost from one invocation to the next.
+'''
+import asyncio
+import getopt
+import json
+import statistics
+import sys
+import time
+from async_socket import AsyncReliableSocket
+from link_emulator import LinkEmulator, LinkModel
+
+# the longest a single run may take, in seconds
+RUN_TIME_OUT = 120
+
+
+async def run(size: int, window: int, loss: float, delay: float,
+              bandwidth: float, seed: int, options: dict) -> dict:
+    '''
+    Sends a message of size characters through a link that loses loss of
+    the datagrams in each direction, and returns the completion time in
+    seconds (None if it timed out), the throughput in bytes per second and
+    what happened on the way.
+    '''
+    receiver = AsyncReliableSocket("127.0.0.1", 0, window, **options)
+    sender = AsyncReliableSocket("127.0.0.1", 0, window, **options)
+    link = LinkEmulator(receiver.getsockname(),
+                        LinkModel(loss=loss, delay=delay, bandwidth=bandwidth, seed=seed),
+                        LinkModel(loss=loss, delay=delay, bandwidth=bandwidth, seed=seed + 1))
+    message = "x" * size
+    sending = None
+    try:
+        link.start()
+        start = time.time()
+        sending = asyncio.ensure_future(sender.sendto(link.address, message))
+        try:
+            received, _ = await asyncio.wait_for(receiver.recvfrom(), RUN_TIME_OUT)
+            elapsed = time.time() - start
+            assert received == message
+            await asyncio.wait_for(sending, RUN_TIME_OUT)
+        except asyncio.TimeoutError:
+            elapsed = None
+        metrics = sender.metrics().get(link.address, {})
+        return {
+            "time": elapsed,
+            "throughput": size / elapsed if elapsed else None,
+            "datagrams": link.stats()["forward"]["datagrams"],
+            "retransmissions": metrics.get("retransmissions", 0),
+        }
+    finally:
+        if sending is not None:
+            sending.cancel()
+        link.close()
+        sender.close()
+        receiver.close()
+
+
+async def benchmark(size: int, windows, losses, delay: float, bandwidth: float,
+                    repeat: int, options: dict):
+    '''
+    Runs every window size against every loss rate repeat times and prints
+    the median of each cell.
+    '''
+    print("%8s %6s %10s %12s %10s %8s" % ("window", "loss", "time (s)",
+                                           "throughput", "datagrams", "resent"))
+    for window in windows:
+        for loss in losses:
+            runs = [await run(size, window, loss, delay, bandwidth, seed, options)
+                    for seed in range(repeat)]
+            done = [r for r in runs if r["time"] is not None]
+            if not done:
+                print("%8d %6.3f %10s" % (window, loss, "timed out"))
+                continue
+            print("%8d %6.3f %10.3f %10.2fMB %10d %8d%s" % (
+                window, loss,
+                statistics.median(r["time"] for r in done),
+                statistics.median(r["throughput"] for r in done) / 1e6,
+                statistics.median(r["datagrams"] for r in done),
+                statistics.median(r["retransmissions"] for r in done),
+                "" if len(done) == len(runs) else
+                " (%d timed out)" % (len(runs) - len(done))))
+
+
+if __name__ == "__main__":
+    def helper():
+        print("Benchmark of the reliable transport through an emulated link")
+        print("-s SIZE | --size=SIZE Characters per message, defaults to 1000000")
+        print("-w WINDOWS | --windows=WINDOWS Window sizes, defaults to 1,4,16,64")
+        print("-l LOSSES | --losses=LOSSES Loss rates, defaults to 0,0.01,0.05,0.1")
+        print("-d DELAY | --delay=DELAY One way delay in ms, defaults to 5")
+        print("-b BANDWIDTH | --bandwidth=BANDWIDTH Link bandwidth in MB/s, defaults to no limit")
+        print("-r REPEAT | --repeat=REPEAT Runs per cell, defaults to 3")
+        print("-o OPTION=VALUE | --option=OPTION=VALUE A socket option, VALUE in JSON")
+        print("-h | --help Print this help")
+    try:
+        OPTS, ARGS = getopt.getopt(sys.argv[1:], "s:w:l:d:b:r:o:h",
+                                   ["size=", "windows=", "losses=", "delay=",
+                                    "bandwidth=", "repeat=", "option=", "help"])
+    except getopt.error:
+        helper()
+        exit(1)
+
+    SIZE = 1000000
+    WINDOWS = [1, 4, 16, 64]
+    LOSSES = [0, 0.01, 0.05, 0.1]
+    DELAY = 0.005
+    BANDWIDTH = None
+    REPEAT = 3
+    OPTIONS = {}
+    for o, a in OPTS:
+        if o in ("-s", "--size"):
+            SIZE = int(a)
+        elif o in ("-w", "--windows"):
+            WINDOWS = [int(w) for w in a.split(",")]
+        elif o in ("-l", "--losses"):
+            LOSSES = [float(l) for l in a.split(",")]
+        elif o in ("-d", "--delay"):
+            DELAY = float(a) / 1000
+        elif o in ("-b", "--bandwidth"):
+            BANDWIDTH = float(a) * 1e6
+        elif o in ("-r", "--repeat"):
+            REPEAT = int(a)
+        elif o in ("-o", "--option"):
+            NAME, VALUE = a.split("=", 1)
+            OPTIONS[NAME] = json.loads(VALUE)
+        else:
+            helper()
+            exit(0)
+
+    asyncio.run(benchmark(SIZE, WINDOWS, LOSSES, DELAY, BANDWIDTH, REPEAT, OPTIONS))
@@ -0,0 +1,78 @@
+'''
+This module computes the CRC32 checksums of packets. It works on bytes-like
+objects (bytes, bytearray, memoryview) without copying or re-encoding them,
+and a checksum can be carried over several buffers, such as the header and
+the payload of a packet, instead of over one joined packet.
+
+Run as a script, it times the text codec against the str path it replaced,
+which built packets with util.make_packet and checked them by decoding,
+splitting and re-encoding them:
+
+    python3 checksum.py [packets]
+'''
+import binascii
+
+
+def crc32(*parts, value: int = 0) -> int:
+    '''
+    Returns the CRC32 of the concatenation of parts, continuing from value,
+    the CRC32 of whatever comes before them.
+    '''
+    for part in parts:
+        value = binascii.crc32(part, value)
+    return value
+
+
+def text_checksum(*parts) -> bytes:
+    '''
+    Returns the checksum field of a text packet covering parts: the CRC32 in
+    decimal digits.
+    '''
+    return b"%d" % crc32(*parts)
+
+
+def validate_text(packet: bytes, start: int = 0) -> bool:
+    '''
+    Validates the text packet `<type>|<seq>|<body>|<checksum>` that begins
+    at start in packet, without decoding it.
+    '''
+    separator = packet.rfind(b"|", start)
+    if separator < 0:
+        return False
+    covered = memoryview(packet)[start:separator + 1]
+    return packet[separator + 1:] == text_checksum(covered)
+
+
+def _benchmark(count: int):
+    import timeit
+    import util
+    from codec import TextCodec
+
+    text = TextCodec()
+    body = "x" * (util.CHUNK_SIZE - 40)
+    datagram = b"".join(text.encode("s", 1, "data", 1, body))
+
+    def encode_str():
+        # the datagram as built from util.make_packet
+        return (f"s:1:{util.make_packet('data', 1, body)}").encode("utf-8")
+
+    def validate_str():
+        # decode the datagram, split it and check the re-encoded packet
+        packet = ':'.join(datagram.decode("utf-8").split(':')[2:])
+        msg, crc = packet.rsplit('|', 1)
+        return util.generate_checksum((msg + '|').encode()) == crc
+
+    cases = [
+        ("send, str", encode_str),
+        ("send, bytes", lambda: text.encode("s", 1, "data", 1, body)),
+        ("receive, str", validate_str),
+        ("receive, bytes", lambda: validate_text(datagram, 4)),
+    ]
+    for name, case in cases:
+        seconds = min(timeit.repeat(case, number=count, repeat=5))
+        print("%-16s %6.2f us per packet" % (name, seconds / count * 1e6))
+
+
+if __name__ == "__main__":
+    import sys
+    _benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
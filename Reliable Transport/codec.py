@@ -0,0 +1,234 @@
+'''
+This module turns the packets of the reliable transport into UDP datagrams and
+back. Two wire formats are supported:
+
+text:
+    `<role>:<msg_id>:<packet_type>|<sequence_number>|<body>|<checksum>` in
+    UTF-8, as built by util.make_packet. This is the original format.
+binary:
+    a fixed 16 byte header followed by the raw payload, see BinaryCodec.
+
+A socket picks the format it sends in, and recognizes the format of every
+datagram it receives from its first byte, so that it can talk to peers using
+either one and always answers a peer in the peer's format.
+'''
+import socket
+import struct
+import sys
+from typing import List, Optional, Tuple
+import util
+import checksum
+
+Datagram = List[bytes]
+
+SENDER = "s"
+RECEIVER = "r"
+
+
+class TextCodec:
+    '''
+    The original text format. Bodies are str.
+    '''
+    name = "text"
+    binary = False
+    # the format has no limit of its own, but the packets of a stream, whose
+    # length is not known, are sized for sequence numbers up to this one
+    MAX_SEQ_NO = 10 ** 12
+
+    def encode(self, role: str, msg_id: int, p_type: str, seq_no: int,
+               body="") -> Datagram:
+        '''
+        Builds the datagram of a packet, the bytes of util.make_packet
+        prefixed with the role and msg_id, as a [packet, checksum] list. The
+        packet is encoded once and checksummed in place.
+        '''
+        prefix = f"{role}:{msg_id}:"
+        packet = f"{prefix}{p_type}|{seq_no}|{body}|".encode("utf-8")
+        return [packet, checksum.text_checksum(memoryview(packet)[len(prefix):])]
+
+    def overhead(self, msg_id: int, seq_no: int) -> int:
+        '''
+        Returns the bytes a data packet adds to its body, for sequence
+        numbers up to seq_no: the prefix, the separators and the checksum,
+        which is a CRC32 of at most 10 decimal digits.
+        '''
+        return len(f"{SENDER}:{msg_id}:data|{seq_no}||") + 10
+
+    def decode(self, datagram) -> Optional[Tuple[str, int, str]]:
+        '''
+        Validates a datagram and splits it into (role, msg_id, packet), or
+        returns None if it is malformed or corrupted. The checksum is checked
+        on the received bytes, before anything is decoded.
+        '''
+        datagram = bytes(datagram)
+        role_end = datagram.find(b":")
+        msg_id_end = datagram.find(b":", role_end + 1)
+        if role_end < 0 or msg_id_end < 0:
+            return None
+        if not checksum.validate_text(datagram, msg_id_end + 1):
+            return None
+        try:
+            return (datagram[:role_end].decode("utf-8"),
+                    int(datagram[role_end + 1:msg_id_end]),
+                    datagram[msg_id_end + 1:].decode("utf-8"))
+        except (UnicodeDecodeError, ValueError):
+            return None
+
+    def parse(self, packet: str) -> Optional[Tuple[str, int, str]]:
+        '''
+        Returns (packet_type, sequence_number, body) of a packet returned by
+        decode, or None if it is malformed. The checksum has already been
+        checked by decode.
+        '''
+        p_type, p_seq_no, p_data, p_checksum = util.parse_packet(packet)
+        try:
+            return p_type, int(p_seq_no), p_data
+        except ValueError:
+            return None
+
+
+class BinaryCodec:
+    '''
+    A compact binary format that carries arbitrary bytes. Every datagram is
+
+        magic (1) | flags (1) | msg_id (4) | seq_no (4) | length (2) | crc32 (4)
+
+    in network byte order, followed by length bytes of payload. The low bits of
+    flags hold the packet type and RECEIVER_FLAG marks packets sent by a
+    message receiver. crc32 covers the first 12 bytes of the header and the
+    payload.
+
+    The header and the payload are handed to the socket as separate buffers
+    and decoded payloads are memoryviews of the received datagram, so payloads
+    are not copied on either side. Data and parity bodies are bytes-like; the
+    bodies of start, ack and end packets are str.
+    '''
+    name = "binary"
+    binary = True
+    MAX_SEQ_NO = 2 ** 32 - 1  # seq_no is 4 bytes in the header
+
+    MAGIC = 0xB7
+    HEADER = struct.Struct("!BBIIHI")
+    CHECKED = 12  # header bytes covered by the checksum
+    RECEIVER_FLAG = 0x80
+    TYPES = ("start", "data", "ack", "end", "parity")
+    TYPE_CODES = {p_type: code for code, p_type in enumerate(TYPES)}
+
+    def encode(self, role: str, msg_id: int, p_type: str, seq_no: int,
+               body=b"") -> Datagram:
+        '''
+        Builds the datagram of a packet as a [header, payload] list.
+        '''
+        payload = body.encode("utf-8") if isinstance(body, str) else body
+        flags = self.TYPE_CODES[p_type]
+        if role == RECEIVER:
+            flags |= self.RECEIVER_FLAG
+        header = self.HEADER.pack(self.MAGIC, flags, msg_id, seq_no,
+                                  len(payload), 0)
+        crc = checksum.crc32(header[:self.CHECKED], payload)
+        header = header[:self.CHECKED] + struct.pack("!I", crc)
+        return [header, payload]
+
+    def overhead(self, msg_id: int, seq_no: int) -> int:
+        '''
+        Returns the bytes a data packet adds to its body: the header.
+        '''
+        return self.HEADER.size
+
+    def decode(self, datagram) -> Optional[Tuple[str, int, tuple]]:
+        '''
+        Validates a datagram and splits it into (role, msg_id, packet), or
+        returns None if it is malformed or corrupted.
+        '''
+        view = memoryview(datagram)
+        if len(view) < self.HEADER.size:
+            return None
+        magic, flags, msg_id, seq_no, length, crc = \
+            self.HEADER.unpack_from(view)
+        payload = view[self.HEADER.size:]
+        if magic != self.MAGIC or length != len(payload):
+            return None
+        if checksum.crc32(view[:self.CHECKED], payload) != crc:
+            return None
+        p_code = flags & ~self.RECEIVER_FLAG
+        if p_code >= len(self.TYPES):
+            return None
+        role = RECEIVER if flags & self.RECEIVER_FLAG else SENDER
+        return role, msg_id, (self.TYPES[p_code], seq_no, payload)
+
+    def parse(self, packet: tuple) -> Optional[Tuple[str, int, object]]:
+        '''
+        Returns (packet_type, sequence_number, body) of a packet returned by
+        decode. The checksum has already been checked by decode.
+        '''
+        p_type, seq_no, payload = packet
+        if p_type not in ("data", "parity"):
+            return p_type, seq_no, str(payload, "utf-8")
+        return p_type, seq_no, payload
+
+
+CODECS = {codec.name: codec for codec in (TextCodec(), BinaryCodec())}
+
+
+def get_codec(name: str):
+    '''
+    Returns the codec of a wire format name ("text" or "binary").
+    '''
+    if name not in CODECS:
+        raise ValueError("unknown wire format %r" % name)
+    return CODECS[name]
+
+
+def detect(datagram):
+    '''
+    Returns the codec a received datagram was built with.
+    '''
+    if datagram[:1] == bytes([BinaryCodec.MAGIC]):
+        return CODECS["binary"]
+    return CODECS["text"]
+
+
+def send_datagram(sock: socket.socket, datagram: Datagram, addr):
+    '''
+    Sends the buffers of a datagram in a single system call, without joining
+    them first where the platform supports it. On a non-blocking socket a
+    datagram that does not fit in the send buffer is dropped, like any other
+    lost packet.
+    '''
+    try:
+        if hasattr(sock, "sendmsg"):
+            sock.sendmsg(datagram, (), 0, addr)
+        else:
+            sock.sendto(b"".join(datagram), addr)
+    except BlockingIOError:
+        pass
+
+
+# Linux socket options for the path MTU, which the socket module does not name
+IP_MTU_DISCOVER = 10
+IP_PMTUDISC_DO = 2
+IP_MTU = 14
+# IPv4 and UDP headers
+IP_UDP_HEADERS = 28
+
+
+def probe_datagram_size(addr, limit: int = util.MAX_DATAGRAM_SIZE) -> int:
+    '''
+    Returns the largest datagram that reaches addr without being fragmented,
+    and at most limit: the kernel's MTU of the path to addr, which starts
+    from the MTU of the interface on the route and drops when a router
+    reports a smaller one, minus the IPv4 and UDP headers. Where the path MTU
+    cannot be read (other platforms, IPv6), limit is returned.
+    '''
+    if not sys.platform.startswith("linux"):
+        return limit
+    probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        probe.setsockopt(socket.IPPROTO_IP, IP_MTU_DISCOVER, IP_PMTUDISC_DO)
+        probe.connect(addr)
+        mtu = probe.getsockopt(socket.IPPROTO_IP, IP_MTU)
+    except OSError:
+        return limit
+    finally:
+        probe.close()
+    return max(min(mtu - IP_UDP_HEADERS, limit), 1)
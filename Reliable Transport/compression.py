@@ -0,0 +1,49 @@
+'''
+This module compresses whole messages before the sender chunks them. A
+compressed message is marked by the "compress=<method>" option of its start
+packet, so the receiver knows to decompress it once it is complete.
+
+The text wire format cannot carry arbitrary bytes, so it sends the compressed
+message in base64. A message is sent as it is if compressing it does not
+make it smaller.
+'''
+import base64
+import lzma
+import zlib
+
+METHODS = {
+    "zlib": (zlib.compress, zlib.decompress),
+    "lzma": (lzma.compress, lzma.decompress),
+}
+
+
+def check_method(name: str) -> str:
+    '''
+    Returns name if it is a compression method, or raises ValueError.
+    '''
+    if name not in METHODS:
+        raise ValueError("unknown compression method %r" % name)
+    return name
+
+
+def compress(message, method: str, binary: bool):
+    '''
+    Returns the compressed body of a bytes-like message: bytes for the binary
+    wire format, or base64 str for the text format. Returns None if that is
+    no smaller than the message.
+    '''
+    compressed = METHODS[method][0](message)
+    if not binary:
+        compressed = base64.b64encode(compressed).decode("ascii")
+    if len(compressed) >= len(message):
+        return None
+    return compressed
+
+
+def decompress(body, method: str) -> bytes:
+    '''
+    Returns the message of a body made by compress.
+    '''
+    if isinstance(body, str):
+        body = base64.b64decode(body)
+    return METHODS[check_method(method)][1](body)
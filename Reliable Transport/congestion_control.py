@@ -0,0 +1,58 @@
+'''
+This module limits the number of packets a sender keeps in flight to what the
+path to a peer can carry.
+'''
+from threading import Lock
+import util
+
+
+class CongestionController:
+    '''
+    Reno style congestion window for a single peer.
+
+    The congestion window (cwnd) starts at util.INITIAL_CWND packets and grows
+    by one packet per acknowledged packet (slow start) until it reaches the
+    slow start threshold, and by one packet per window after that (additive
+    increase). Every loss, whether detected by duplicate ACKs or by a
+    retransmission timeout, halves it (multiplicative decrease). Unlike Reno,
+    a timeout does not restart slow start from a single packet: on a lossy
+    path the lone retransmission and its ACK are as likely to be lost as any
+    other packet, and every such loss doubles the timeout. It never exceeds
+    the window_size the socket was configured with.
+
+    Like the RttEstimator, it is shared by every ReliableMessageSender talking
+    to the same receiver address.
+    '''
+
+    def __init__(self, max_window: int,
+                 initial_window: int = util.INITIAL_CWND):
+        self.max_window = max_window
+        self.cwnd = float(min(initial_window, max_window))
+        self.ssthresh = float(max_window)
+        self.lock = Lock()
+
+    def window(self) -> int:
+        '''
+        Returns the number of packets that may currently be in flight.
+        '''
+        with self.lock:
+            return max(1, min(int(self.cwnd), self.max_window))
+
+    def on_ack(self, acked: int):
+        '''
+        Opens the window after an ACK acknowledged acked new packets.
+        '''
+        with self.lock:
+            if self.cwnd < self.ssthresh:
+                self.cwnd += acked
+            else:
+                self.cwnd += acked / self.cwnd
+            self.cwnd = min(self.cwnd, float(self.max_window))
+
+    def on_loss(self):
+        '''
+        Halves the window after a fast retransmit or a retransmission timeout.
+        '''
+        with self.lock:
+            self.ssthresh = max(self.cwnd / 2, 2.0)
+            self.cwnd = self.ssthresh
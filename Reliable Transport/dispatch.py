@@ -0,0 +1,126 @@
+'''
+This module holds the state a socket keeps for its peers, sharded by peer
+address: every peer has a Peer holding its senders and receivers, keyed by
+message id, and everything learnt about the path to it. A packet is
+dispatched with one lookup of its address and one of its message id, and a
+peer that has gone quiet is forgotten as a whole.
+'''
+import time
+from random import randint
+from typing import Dict, Iterator, Optional, Tuple
+from rtt_estimator import RttEstimator
+from metrics import PeerMetrics
+import util
+
+Address = Tuple[str, int]
+
+
+class Peer:
+    '''
+    The messages a socket exchanges with one address, and the state shared
+    by its senders: the RTT estimator and the metrics, and the congestion
+    controller, pacer, datagram size and session once the socket creates
+    them.
+    '''
+
+    def __init__(self, address: Address):
+        self.address = address
+        self.senders = dict()
+        self.receivers = dict()
+        self.rtt_estimator = RttEstimator()
+        self.metrics = PeerMetrics()
+        self.congestion = None
+        self.pacer = None
+        self.datagram_size = None
+        # the open session to the peer, in sessions mode
+        self.session = None
+        # when the peer last had a sender or a receiver
+        self.last_active = time.time()
+        # the message id new_msg_id tries next
+        self.next_msg_id = randint(util.MIN_MSG_ID, util.MAX_MSG_ID)
+
+    def new_msg_id(self) -> Optional[int]:
+        '''
+        Returns a message id that no sender of the peer has, or None if they
+        are all taken. The ids are taken in turn, wrapping around from
+        util.MAX_MSG_ID to util.MIN_MSG_ID, so an id comes back as late as
+        possible after its message is done, for the receiver to have
+        forgotten it.
+        '''
+        if len(self.senders) > util.MAX_MSG_ID - util.MIN_MSG_ID:
+            return None
+        msg_id = self.next_msg_id
+        # the ids taken are skipped once per turn, each of them
+        while msg_id in self.senders:
+            msg_id = msg_id + 1 if msg_id < util.MAX_MSG_ID else util.MIN_MSG_ID
+        self.next_msg_id = msg_id + 1 if msg_id < util.MAX_MSG_ID else util.MIN_MSG_ID
+        return msg_id
+
+    def idle(self) -> bool:
+        '''
+        Tells whether the socket keeps no message of the peer.
+        '''
+        return not self.senders and not self.receivers
+
+
+class PeerTable:
+    '''
+    The Peer of every address a socket exchanges messages with.
+
+    It is only used from the event loop of the socket, which is the only
+    thread that dispatches packets, so it takes no locks.
+    '''
+
+    def __init__(self):
+        self.peers: Dict[Address, Peer] = dict()
+
+    def get(self, address: Address) -> Optional[Peer]:
+        '''
+        Returns the Peer of an address, or None if there is none.
+        '''
+        return self.peers.get(address)
+
+    def peer(self, address: Address) -> Peer:
+        '''
+        Returns the Peer of an address, creating it on first use.
+        '''
+        peer = self.peers.get(address)
+        if peer is None:
+            peer = self.peers[address] = Peer(address)
+        return peer
+
+    def sender(self, address: Address, msg_id: int):
+        '''
+        Returns the sender of a message, or None if there is none.
+        '''
+        peer = self.peers.get(address)
+        return None if peer is None else peer.senders.get(msg_id)
+
+    def receiver(self, address: Address, msg_id: int):
+        '''
+        Returns the receiver of a message, or None if there is none.
+        '''
+        peer = self.peers.get(address)
+        return None if peer is None else peer.receivers.get(msg_id)
+
+    def __iter__(self) -> Iterator[Peer]:
+        return iter(self.peers.values())
+
+    def __len__(self) -> int:
+        return len(self.peers)
+
+    def forget_idle(self, idle_time: float) -> int:
+        '''
+        Forgets the peers that have had no message for idle_time seconds,
+        along with what was learnt about them. Returns how many there were.
+        '''
+        now = time.time()
+        forgotten = []
+        for address, peer in self.peers.items():
+            if not peer.idle():
+                peer.last_active = now
+            elif now - peer.last_active >= idle_time:
+                forgotten.append(address)
+        for address in forgotten:
+            del self.peers[address]
+        return len(forgotten)
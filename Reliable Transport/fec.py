@@ -0,0 +1,160 @@
+'''
+This module adds forward error correction to the data packets of a message.
+The sender follows every block of up to block_size data packets with a parity
+packet, the XOR of their payloads, from which the receiver rebuilds any one
+lost packet of the block instead of waiting for its retransmission.
+
+A parity packet has the type "parity" and the sequence number of the first
+packet of its block. Its payload is
+
+    count (2) | XOR of the payload lengths (2) | XOR of the payloads
+
+in network byte order, the payloads being padded with zeros to the longest
+one. The text format carries it in base64. Parity packets are not part of
+the sequence space: they are neither acknowledged nor retransmitted.
+'''
+import base64
+import struct
+from typing import Dict, List, Optional, Tuple
+
+HEADER = struct.Struct("!HH")
+# "parity" is two characters longer than "data" in the text format
+TEXT_TYPE_OVERHEAD = len("parity") - len("data")
+
+
+def _as_bytes(chunk):
+    return chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+
+
+class ParityEncoder:
+    '''
+    Builds the parity packet bodies of the data packets of a sender, in the
+    order they are made.
+    '''
+
+    def __init__(self, block_size: int, binary: bool):
+        self.block_size = block_size
+        self.binary = binary
+        self.first = None
+        self.count = 0
+        self.lengths = 0
+        self.longest = 0
+        self.parity = 0
+
+    def chunk_size(self, payload_size: int) -> int:
+        '''
+        Returns the bytes of payload a data packet may carry so that the
+        parity packet of its block fits where a data packet of payload_size
+        bytes does.
+        '''
+        if self.binary:
+            return payload_size - HEADER.size
+        # base64 turns every 3 bytes into 4 characters
+        return 3 * ((payload_size - TEXT_TYPE_OVERHEAD) // 4) - HEADER.size
+
+    def add(self, seq_no: int, chunk) -> Optional[Tuple[int, int, object]]:
+        '''
+        Adds the payload of the next data packet. Returns (first, last, body)
+        of the parity packet of the block it completes, if it does.
+        '''
+        payload = _as_bytes(chunk)
+        if self.first is None:
+            self.first = seq_no
+        self.count += 1
+        self.lengths ^= len(payload)
+        self.longest = max(self.longest, len(payload))
+        # little-endian, so that shorter payloads are padded with zeros
+        self.parity ^= int.from_bytes(payload, "little")
+        if self.count == self.block_size:
+            return self.flush()
+        return None
+
+    def flush(self) -> Optional[Tuple[int, int, object]]:
+        '''
+        Ends the current block early, such as at the end of a message.
+        Returns (first, last, body) of its parity packet, if it has any data.
+        '''
+        if self.first is None:
+            return None
+        payload = HEADER.pack(self.count, self.lengths) + \
+            self.parity.to_bytes(self.longest, "little")
+        block = (self.first, self.first + self.count - 1,
+                 payload if self.binary else base64.b64encode(payload).decode("ascii"))
+        self.first = None
+        self.count = self.lengths = self.longest = self.parity = 0
+        return block
+
+
+class ParityDecoder:
+    '''
+    Rebuilds the lost data packets of a receiver from its parity packets.
+
+    The payloads received lately are kept (by reference) until they fall
+    block_size packets below the cumulative ACK: a block with a single
+    missing packet cannot start any lower than that.
+    '''
+
+    def __init__(self, block_size: int, binary: bool, first_seq_no: int):
+        self.block_size = block_size
+        self.binary = binary
+        self.chunks = dict()
+        # the lowest sequence number that may still be in chunks
+        self.low = first_seq_no
+        # first sequence number -> (count, XOR of the lengths, XOR of the payloads)
+        self.parities: Dict[int, Tuple[int, int, bytes]] = dict()
+
+    def add(self, seq_no: int, chunk):
+        '''
+        Records the payload of a data packet that has been received.
+        '''
+        if seq_no >= self.low:
+            self.chunks[seq_no] = chunk
+
+    def add_parity(self, first: int, body):
+        '''
+        Records a parity packet. Malformed ones are ignored.
+        '''
+        try:
+            payload = bytes(body) if self.binary else base64.b64decode(body, validate=True)
+            count, lengths = HEADER.unpack_from(payload)
+        except (ValueError, struct.error):
+            return
+        if 0 < count <= self.block_size:
+            self.parities[first] = (count, lengths, payload[HEADER.size:])
+
+    def recover(self, cumulative_ack: int) -> List[Tuple[int, object]]:
+        '''
+        Rebuilds the data packets that are the only ones missing from a block
+        whose parity packet has been received, and returns them as
+        (sequence_number, payload) pairs.
+        '''
+        while self.low < cumulative_ack - self.block_size:
+            self.chunks.pop(self.low, None)
+            self.low += 1
+
+        recovered = []
+        for first in list(self.parities):
+            count, lengths, parity = self.parities[first]
+            missing = [seq_no for seq_no in range(max(first, cumulative_ack), first + count)
+                       if seq_no not in self.chunks]
+            if len(missing) > 1:
+                continue
+            del self.parities[first]
+            if not missing:
+                continue
+            value = int.from_bytes(parity, "little")
+            for seq_no in range(first, first + count):
+                if seq_no != missing[0]:
+                    payload = _as_bytes(self.chunks[seq_no])
+                    lengths ^= len(payload)
+                    value ^= int.from_bytes(payload, "little")
+            try:
+                # a parity packet that does not match its block fails here
+                payload = value.to_bytes(len(parity), "little")[:lengths]
+                if not self.binary:
+                    payload = payload.decode("utf-8")
+            except (OverflowError, UnicodeDecodeError):
+                continue
+            self.chunks[missing[0]] = payload
+            recovered.append((missing[0], payload))
+        return recovered
@@ -0,0 +1,83 @@
+'''
+This module limits the data a sender keeps in flight to the space the
+receiving socket has left for it. Streams are held back by their reader
+instead, see stream.StreamReader.
+'''
+
+
+class ReceiveWindow:
+    '''
+    The receive buffer of a socket: the bytes (characters of a text message)
+    held by the chunks its receivers are reassembling, and by the messages
+    they completed that have not been read yet.
+
+    Its free space is shared out between the messages being received: each
+    receiver advertises its share on its ACKs as "wnd=<bytes>", and its
+    sender keeps at most that much data in flight, so that a reader that
+    falls behind holds its senders back instead of the socket buffering
+    without bound.
+
+    Data beyond what a receiver advertised that arrives while the buffer is
+    full is turned away, as long as there are messages to read, whose
+    reading frees space. When there are none, the window never closes and
+    data is taken beyond it, so that partly received messages cannot fill
+    the buffer and block each other.
+
+    It is shared by every ReliableMessageReceiver of the socket, and is only
+    used from the socket's event loop.
+    '''
+
+    def __init__(self, size: int):
+        self.size = size
+        self.used = 0
+        # the bytes of the messages that have not been read
+        self.unread = 0
+        # the messages being received
+        self.receivers = 0
+
+    def window(self) -> int:
+        '''
+        Returns the bytes that may still be received.
+        '''
+        return max(self.size - self.used, 0)
+
+    def share(self) -> int:
+        '''
+        Returns the bytes that each message being received may still receive.
+        '''
+        share = self.window() // max(self.receivers, 1)
+        if self.unread == 0:
+            share = max(share, 1)
+        return share
+
+    def full(self) -> bool:
+        '''
+        Tells whether data has to be turned away for now.
+        '''
+        return self.used >= self.size and self.unread > 0
+
+    def hold(self, size: int):
+        '''
+        Takes up size bytes of the buffer.
+        '''
+        self.used += size
+
+    def hold_unread(self, size: int):
+        '''
+        Takes up the size bytes of a message until it is read.
+        '''
+        self.used += size
+        self.unread += size
+
+    def release_unread(self, size: int):
+        '''
+        Frees the size bytes of a message that has been read.
+        '''
+        self.used -= size
+        self.unread -= size
+
+    def release(self, size: int):
+        '''
+        Frees size bytes of the buffer.
+        '''
+        self.used -= size
@@ -0,0 +1,201 @@
+'''
+This module emulates a lossy link between two sockets in the same process, for
+tests and benchmarks (see benchmark.py) that need loss, duplication,
+reordering, delay and a bandwidth limit without the subprocesses and polling
+of TestHarness.py.
+
+The LinkEmulator is a UDP relay. One side sends to its address instead of to
+the other side, and the other side sees the relay's second address instead of
+the first side's, so both of them talk through it without knowing. Every
+datagram is handed to the LinkModel of its direction, which decides whether
+it is lost, duplicated or held back, and when each copy is delivered; the
+relay then delivers it with a timer of its event loop, so it adds no polling
+delay of its own.
+
+The fate of a datagram is drawn from the model's own random.Random, with the
+same number of draws for every datagram, so the n-th datagram in a direction
+meets the same fate for the same seed whatever the timing. Only the drops of
+a full bandwidth queue depend on timing.
+'''
+import asyncio
+import random
+import socket
+import time
+from threading import Thread
+from typing import Dict, List, Tuple
+import util
+
+Address = Tuple[str, int]
+
+
+class LinkModel:
+    '''
+    One direction of an emulated link.
+
+    Each datagram is
+        - lost with probability loss,
+        - otherwise sent out at the bandwidth of the link (bytes per second,
+          None for no limit) after the datagrams ahead of it, and tail dropped
+          if more than queue bytes are waiting to be sent,
+        - delivered delay seconds later, plus up to jitter seconds,
+        - held back for reorder_delay more seconds with probability reorder,
+          so that the datagrams behind it overtake it, and
+        - delivered twice with probability duplicate, the copy
+          duplicate_delay seconds after the original.
+    '''
+
+    def __init__(self, loss: float = 0.0, duplicate: float = 0.0,
+                 reorder: float = 0.0, delay: float = 0.0, jitter: float = 0.0,
+                 bandwidth: float = None, queue: int = 64 * 1024,
+                 reorder_delay: float = 0.002, duplicate_delay: float = 0.0,
+                 seed: int = 0):
+        self.loss = loss
+        self.duplicate = duplicate
+        self.reorder = reorder
+        self.delay = delay
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.queue = queue
+        self.reorder_delay = reorder_delay
+        self.duplicate_delay = duplicate_delay
+        self.random = random.Random(seed)
+        # when the datagrams accepted so far will all have been sent out
+        self.busy_until = 0.0
+        self.stats = {"datagrams": 0, "bytes": 0, "lost": 0, "queue_drops": 0,
+                      "duplicated": 0, "reordered": 0}
+
+    def fate(self, size: int, now: float) -> List[float]:
+        '''
+        Returns when each copy of a datagram of size bytes that is sent at
+        now is delivered, which is no copy if it is lost.
+        '''
+        lost, duplicated, reordered, jitter = (self.random.random() for _ in range(4))
+        self.stats["datagrams"] += 1
+        self.stats["bytes"] += size
+        if lost < self.loss:
+            self.stats["lost"] += 1
+            return []
+
+        sent = now
+        if self.bandwidth is not None:
+            start = max(now, self.busy_until)
+            if (start - now) * self.bandwidth > self.queue:
+                self.stats["queue_drops"] += 1
+                return []
+            self.busy_until = sent = start + size / self.bandwidth
+
+        arrival = sent + self.delay + jitter * self.jitter
+        if reordered < self.reorder:
+            self.stats["reordered"] += 1
+            arrival += self.reorder_delay
+        if duplicated < self.duplicate:
+            self.stats["duplicated"] += 1
+            return [arrival, arrival + self.duplicate_delay]
+        return [arrival]
+
+
+class LinkEmulator:
+    '''
+    Relays the datagrams between a socket and the socket at target through
+    an emulated link, with a LinkModel for each direction.
+
+    The first socket sends to address; the relay learns its address from
+    the first datagram it gets there, and the target sees every datagram
+    coming from target_side. The relay runs an event loop of its own in a
+    thread, like ReliableSocket, from start until close.
+    '''
+
+    def __init__(self, target: Address, forward: LinkModel = None,
+                 backward: LinkModel = None, host: str = "127.0.0.1",
+                 bufsize: int = 65536):
+        self.target = target
+        self.forward = forward if forward is not None else LinkModel()
+        self.backward = backward if backward is not None else LinkModel()
+        self.bufsize = bufsize
+        self.source = None
+        self.sockets: Dict[str, socket.socket] = {}
+        for side in ("source_side", "target_side"):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.setblocking(False)
+            # the link drops what its model says, not what the kernel does
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+            sock.bind((host, 0))
+            self.sockets[side] = sock
+        self.address = self.sockets["source_side"].getsockname()
+        self.target_side = self.sockets["target_side"].getsockname()
+        self.loop = None
+        self.thread = None
+
+    def start(self) -> "LinkEmulator":
+        '''
+        Starts relaying, and returns the emulator.
+        '''
+        self.loop = asyncio.new_event_loop()
+        self.loop.add_reader(self.sockets["source_side"].fileno(), self.relay,
+                             "source_side")
+        self.loop.add_reader(self.sockets["target_side"].fileno(), self.relay,
+                             "target_side")
+        self.thread = Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def close(self):
+        '''
+        Stops relaying and closes the relay's sockets. Datagrams still on the
+        link are lost.
+        '''
+        if self.thread is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+            self.loop.close()
+            self.thread = None
+        for sock in self.sockets.values():
+            sock.close()
+
+    def __enter__(self) -> "LinkEmulator":
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        '''
+        Counts what happened to the datagrams in each direction: forward,
+        from the first socket to the target, and backward.
+        '''
+        return {"forward": dict(self.forward.stats),
+                "backward": dict(self.backward.stats)}
+
+    def relay(self, side: str):
+        '''
+        Reads a batch of the datagrams waiting on one side of the relay and
+        schedules their delivery to the other side.
+        '''
+        sock = self.sockets[side]
+        for _ in range(util.IO_BATCH_SIZE):
+            try:
+                datagram, addr = sock.recvfrom(self.bufsize)
+            except (BlockingIOError, InterruptedError):
+                return
+            except ConnectionRefusedError:
+                # the ICMP error of an earlier datagram
+                continue
+            if side == "source_side":
+                self.source = addr
+                model, out, dest = self.forward, self.sockets["target_side"], self.target
+            elif self.source is not None:
+                model, out, dest = self.backward, self.sockets["source_side"], self.source
+            else:
+                continue
+            now = time.time()
+            for arrival in model.fate(len(datagram), now):
+                self.loop.call_later(max(arrival - now, 0), self.deliver,
+                                     out, datagram, dest)
+
+    @staticmethod
+    def deliver(sock: socket.socket, datagram: bytes, dest: Address):
+        try:
+            sock.sendto(datagram, dest)
+        except OSError:
+            # the socket is closed, or the kernel buffer is full: lost
+            pass
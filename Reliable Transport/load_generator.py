@@ -0,0 +1,307 @@
+'''
+This script puts the chat Server of server.py under load: hundreds of
+simulated clients, all in this process and sharing one event loop, join the
+server and then send messages, send files and request the list of users at
+random (Poisson) times, at the rates asked for:
+
+    python3 load_generator.py [-n CLIENTS] [-t DURATION] [-j JOIN_RATE]
+                              [-m MSG_RATE] [-f FILE_RATE] [-l LIST_RATE]
+                              [-r RECIPIENTS] [-s FILE_SIZE] [-w WINDOW]
+                              [-a ADDRESS -p PORT] [--seed=SEED]
+
+Unless a server is given with -p, a Server is started at ADDRESS in a thread
+of this process, with room for every client and its output discarded.
+
+The latency of a command is the time from the client sending it until it has
+had its effect: until the server has acknowledged a join, until the client
+has the list of users, and until every recipient has a message or file. The
+report gives, for every command, how many were issued and completed (those
+still going DRAIN_TIME_OUT seconds after the load stops never are), how many
+completed per second of load, and the p50 and p99 of their latencies.
+'''
+import asyncio
+import getopt
+import math
+import os
+import random
+import sys
+import time
+from threading import Thread
+from typing import Dict, List, Tuple
+from async_socket import AsyncReliableSocket
+from server import Server
+
+Address = Tuple[str, int]
+
+COMMANDS = ["join", "send_message", "send_file", "request_users_list"]
+# the longest the generator waits for the commands still going at the end
+DRAIN_TIME_OUT = 10
+# how long a client waits for the server to turn its join away
+JOIN_GRACE_TIME = 0.2
+
+
+class LoadGenerator:
+    '''
+    Runs the simulated clients and keeps track of their commands.
+
+    Every message and file carries a token of its own as its body (as its
+    name, for a file), so that a recipient can tell which command it
+    completes; the list requests of a client are answered in order.
+    '''
+
+    def __init__(self, server: Address, clients: int, duration: float,
+                 join_rate: float, rates: Dict[str, float], recipients: int,
+                 file_size: int, window: int, seed: int = 0):
+        self.server = server
+        self.clients = clients
+        self.duration = duration
+        self.join_rate = join_rate
+        self.rates = rates
+        self.recipients = recipients
+        self.file_content = "x" * file_size
+        self.window = window
+        self.random = random.Random(seed)
+        # the usernames of the clients that have joined, and of those that
+        # were turned away
+        self.joined: List[str] = []
+        self.turned_away = set()
+        # token => [command, time sent, recipients still to get it]
+        self.pending: Dict[str, list] = {}
+        self.next_token = 0
+        self.issued = {command: 0 for command in COMMANDS}
+        self.latencies: Dict[str, List[float]] = {command: [] for command in COMMANDS}
+        # set when the clients stop issuing commands, and when they may go
+        self.stopping = None
+        self.done = None
+
+    async def run(self) -> float:
+        '''
+        Runs the clients for the duration, waits for the commands still
+        going, and returns how long that took in seconds.
+        '''
+        self.stopping = asyncio.Event()
+        self.done = asyncio.Event()
+        start = time.time()
+        tasks = [asyncio.ensure_future(self.client("user%d" % i, i / self.join_rate))
+                 for i in range(self.clients)]
+        await asyncio.sleep(self.duration)
+        self.stopping.set()
+        deadline = time.time() + DRAIN_TIME_OUT
+        while self.pending and time.time() < deadline:
+            await asyncio.sleep(0.05)
+        elapsed = time.time() - start
+        self.done.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return elapsed
+
+    async def client(self, name: str, join_after: float):
+        '''
+        Simulates one client: joins after join_after seconds, then issues
+        commands until the generator stops, and disconnects once the
+        commands still going are done.
+        '''
+        if await self.pause(join_after):
+            return
+        # on every interface, so that it can reach a server on another host
+        sock = AsyncReliableSocket("", 0, self.window)
+        # the times at which the client's list requests were sent
+        lists: List[float] = []
+        receiving = asyncio.ensure_future(self.receive(sock, name, lists))
+        try:
+            self.issued["join"] += 1
+            sent = time.time()
+            await sock.sendto(self.server, "join " + name)
+            self.latencies["join"].append(time.time() - sent)
+            # the server only answers a join it turns away
+            await asyncio.sleep(JOIN_GRACE_TIME)
+            if name in self.turned_away:
+                return
+            self.joined.append(name)
+            await asyncio.gather(*(self.issue(sock, name, command, lists)
+                                   for command in COMMANDS[1:]
+                                   if self.rates[command] > 0))
+            await self.done.wait()
+            await sock.sendto(self.server, "disconnect " + name)
+        finally:
+            receiving.cancel()
+            sock.close()
+
+    async def issue(self, sock: AsyncReliableSocket, name: str, command: str,
+                    lists: List[float]):
+        '''
+        Issues a command of a client at its rate, until the generator stops.
+        '''
+        while True:
+            if await self.pause(self.random.expovariate(self.rates[command])):
+                return
+            if command == "request_users_list":
+                lists.append(time.time())
+                self.issued[command] += 1
+                await sock.sendto(self.server, command)
+                continue
+            others = [user for user in self.joined if user != name]
+            if not others:
+                continue
+            to = self.random.sample(others, min(self.recipients, len(others)))
+            token = "t%d" % self.next_token
+            self.next_token += 1
+            body = token if command == "send_message" else \
+                token + " " + self.file_content
+            self.issued[command] += 1
+            self.pending[token] = [command, time.time(), len(to)]
+            await sock.sendto(self.server, "%s %d %s %s" % (
+                command, len(to), " ".join(to), body))
+
+    async def pause(self, seconds: float) -> bool:
+        '''
+        Waits for seconds, and returns whether the clients are to stop
+        issuing commands, without waiting any longer if they are.
+        '''
+        try:
+            await asyncio.wait_for(self.stopping.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+        return self.stopping.is_set()
+
+    async def receive(self, sock: AsyncReliableSocket, name: str, lists: List[float]):
+        '''
+        Takes what the server sends to a client, completing the commands it
+        is a part of.
+        '''
+        while True:
+            message, _ = await sock.recvfrom()
+            message_parts = message.split(" ")
+            if message_parts[0] in ("forward_message", "forward_file"):
+                self.delivered(message_parts[3])
+            elif message_parts[0] == "response_users_list" and lists:
+                self.latencies["request_users_list"].append(time.time() - lists.pop(0))
+            elif message_parts[0].startswith("err_"):
+                self.turned_away.add(name)
+                if name in self.joined:
+                    self.joined.remove(name)
+                return
+
+    def delivered(self, token: str):
+        '''
+        Counts a recipient getting the message or file of a token.
+        '''
+        pending = self.pending.get(token)
+        if pending is None:
+            return
+        pending[2] -= 1
+        if pending[2] == 0:
+            del self.pending[token]
+            self.latencies[pending[0]].append(time.time() - pending[1])
+
+    def report(self, elapsed: float, file=sys.stdout):
+        '''
+        Prints the throughput and latencies of every command to file.
+        '''
+        print("%d clients, %d turned away, %.1f s of load, done after %.1f s" % (
+            self.clients, len(self.turned_away), self.duration, elapsed), file=file)
+        print("%-20s %8s %10s %10s %10s %10s" % (
+            "command", "issued", "completed", "per sec", "p50 (ms)", "p99 (ms)"), file=file)
+        for command in COMMANDS:
+            latencies = sorted(self.latencies[command])
+            if latencies:
+                p50 = "%.1f" % (1000 * percentile(latencies, 50))
+                p99 = "%.1f" % (1000 * percentile(latencies, 99))
+            else:
+                p50 = p99 = "-"
+            print("%-20s %8d %10d %10.1f %10s %10s" % (
+                command, self.issued[command], len(latencies),
+                len(latencies) / self.duration, p50, p99), file=file)
+
+
+def percentile(values: List[float], p: float) -> float:
+    '''
+    Returns the p-th percentile of sorted values, by the nearest rank.
+    '''
+    rank = max(math.ceil(p / 100 * len(values)), 1)
+    return values[rank - 1]
+
+
+def start_server(dest: str, port: int, window: int, max_clients: int):
+    '''
+    Starts a Server at dest in a thread of this process.
+    '''
+    server = Server(dest, port, window, max_clients)
+    Thread(target=server.start, daemon=True).start()
+
+
+if __name__ == "__main__":
+    def helper():
+        print("Load generator for the chat Server")
+        print("-n CLIENTS | --clients=CLIENTS Simulated clients, defaults to 200")
+        print("-t DURATION | --duration=DURATION Seconds of load, defaults to 10")
+        print("-j JOIN_RATE | --join-rate=JOIN_RATE Clients joining per second, defaults to 100")
+        print("-m MSG_RATE | --msg-rate=MSG_RATE Messages per client per second, defaults to 0.2")
+        print("-f FILE_RATE | --file-rate=FILE_RATE Files per client per second, defaults to 0.02")
+        print("-l LIST_RATE | --list-rate=LIST_RATE List requests per client per second, defaults to 0.1")
+        print("-r RECIPIENTS | --recipients=RECIPIENTS Recipients per message or file, defaults to 3")
+        print("-s FILE_SIZE | --file-size=FILE_SIZE Characters per file, defaults to 2000")
+        print("-w WINDOW | --window=WINDOW The window size, defaults to 3")
+        print("-a ADDRESS | --address=ADDRESS The server ip, defaults to localhost")
+        print("-p PORT | --port=PORT The port of a running server, defaults to starting one")
+        print("--seed=SEED Seed of the random times and recipients, defaults to 0")
+        print("-h | --help Print this help")
+    try:
+        OPTS, ARGS = getopt.getopt(sys.argv[1:], "n:t:j:m:f:l:r:s:w:a:p:h",
+                                   ["clients=", "duration=", "join-rate=", "msg-rate=",
+                                    "file-rate=", "list-rate=", "recipients=",
+                                    "file-size=", "window=", "address=", "port=",
+                                    "seed=", "help"])
+    except getopt.error:
+        helper()
+        exit(1)
+
+    CLIENTS = 200
+    DURATION = 10
+    JOIN_RATE = 100
+    RATES = {"send_message": 0.2, "send_file": 0.02, "request_users_list": 0.1}
+    RECIPIENTS = 3
+    FILE_SIZE = 2000
+    WINDOW = 3
+    DEST = "127.0.0.1"
+    PORT = None
+    SEED = 0
+    for o, a in OPTS:
+        if o in ("-n", "--clients"):
+            CLIENTS = int(a)
+        elif o in ("-t", "--duration"):
+            DURATION = float(a)
+        elif o in ("-j", "--join-rate"):
+            JOIN_RATE = float(a)
+        elif o in ("-m", "--msg-rate"):
+            RATES["send_message"] = float(a)
+        elif o in ("-f", "--file-rate"):
+            RATES["send_file"] = float(a)
+        elif o in ("-l", "--list-rate"):
+            RATES["request_users_list"] = float(a)
+        elif o in ("-r", "--recipients"):
+            RECIPIENTS = int(a)
+        elif o in ("-s", "--file-size"):
+            FILE_SIZE = int(a)
+        elif o in ("-w", "--window"):
+            WINDOW = int(a)
+        elif o in ("-a", "--address"):
+            DEST = a
+        elif o in ("-p", "--port"):
+            PORT = int(a)
+        elif o == "--seed":
+            SEED = int(a)
+        else:
+            helper()
+            exit(0)
+
+    OUT = sys.stdout
+    if PORT is None:
+        PORT = random.randint(20000, 60000)
+        # the server prints every command it handles
+        sys.stdout = open(os.devnull, "w")
+        start_server(DEST, PORT, WINDOW, CLIENTS)
+
+    GENERATOR = LoadGenerator((DEST, PORT), CLIENTS, DURATION, JOIN_RATE, RATES,
+                              RECIPIENTS, FILE_SIZE, WINDOW, SEED)
+    ELAPSED = asyncio.run(GENERATOR.run())
+    GENERATOR.report(ELAPSED, OUT)
@@ -0,0 +1,175 @@
+'''
+This module counts what happens to the messages a socket exchanges with each
+peer, so that one can see where the time of a transfer goes: round trip
+times, retransmissions, duplicates, the data in flight and the goodput.
+
+The counters are plain attributes that the senders and receivers of a peer
+increment as they go, so counting costs an addition per packet.
+AsyncReliableSocket.metrics() turns them into a snapshot, and the
+metrics_file option of the socket appends one to a file as a line of JSON
+every metrics_interval seconds.
+'''
+import time
+from bisect import bisect_left
+from typing import Dict, Optional
+
+# the upper bound of the first bucket of an RTT histogram, in seconds
+FIRST_BOUND = 0.0001
+# the number of buckets, each twice as wide as the one before; the last one
+# ends past util.MAX_TIME_OUT
+BUCKETS = 18
+
+
+class Histogram:
+    '''
+    Counts values, such as round trip times in seconds, in buckets whose
+    upper bounds double from one to the next, from first_bound on. Values
+    beyond the last bound are counted in an extra bucket.
+    '''
+
+    def __init__(self, first_bound: float = FIRST_BOUND, buckets: int = BUCKETS):
+        self.bounds = [first_bound * 2 ** i for i in range(buckets)]
+        self.counts = [0] * (buckets + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value: float):
+        '''
+        Counts a value.
+        '''
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, p: float) -> Optional[float]:
+        '''
+        Returns an upper bound of the p-th percentile, the bound of the bucket
+        it falls in (or the largest value, if that is lower), or None if no
+        value has been counted.
+        '''
+        if not self.count:
+            return None
+        rank = p / 100 * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def snapshot(self) -> Dict[str, object]:
+        '''
+        Returns the count, mean, min, p50, p90, p99 and max of the values,
+        and the [upper bound, count] of every bucket that is not empty, the
+        extra bucket having None for its bound.
+        '''
+        bounds = self.bounds + [None]
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else None,
+            "min": self.min,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "max": self.max,
+            "buckets": [[bound, count] for bound, count in zip(bounds, self.counts)
+                        if count],
+        }
+
+
+class PeerMetrics:
+    '''
+    The counters of the messages exchanged with one peer.
+
+    As a sender: the RTT samples, every packet sent and sent again, the
+    retransmission timeouts, fast retransmits and duplicate ACKs, and the
+    messages delivered with their length in characters (bytes of bytes
+    messages). Goodput is that length over the time at least one message
+    was being sent to the peer.
+
+    As a receiver: the packets received, the data packets received more than
+    once, the bytes of data taken (characters of text messages, before any
+    decompression) and the messages received.
+
+    Like the RttEstimator, it is shared by every sender and receiver of the
+    peer.
+    '''
+
+    def __init__(self):
+        self.rtt = Histogram()
+        self.packets_sent = 0
+        self.retransmissions = 0
+        self.timeouts = 0
+        self.fast_retransmits = 0
+        self.duplicate_acks = 0
+        self.messages_sent = 0
+        self.bytes_sent = 0
+        self.packets_received = 0
+        self.duplicate_packets = 0
+        self.messages_received = 0
+        self.bytes_received = 0
+        # messages being sent, and the seconds spent sending at least one
+        self.sending = 0
+        self.busy_since = None
+        self.busy_time = 0.0
+
+    def on_send_started(self):
+        '''
+        Counts a message that starts being sent.
+        '''
+        if self.sending == 0:
+            self.busy_since = time.time()
+        self.sending += 1
+
+    def on_send_finished(self, size: int = None):
+        '''
+        Counts a message that is no longer being sent: delivered, with its
+        length, or abandoned, with None.
+        '''
+        self.sending -= 1
+        if self.sending == 0:
+            self.busy_time += time.time() - self.busy_since
+            self.busy_since = None
+        if size is not None:
+            self.messages_sent += 1
+            self.bytes_sent += size
+
+    def goodput(self) -> Optional[float]:
+        '''
+        Returns the characters (or bytes) delivered per second of sending, or
+        None if nothing has been sent yet.
+        '''
+        busy_time = self.busy_time
+        if self.busy_since is not None:
+            busy_time += time.time() - self.busy_since
+        if busy_time <= 0:
+            return None
+        return self.bytes_sent / busy_time
+
+    def snapshot(self, bytes_in_flight: int = 0) -> Dict[str, object]:
+        '''
+        Returns the counters as a dict, with the bytes in flight the socket
+        counted for the peer.
+        '''
+        return {
+            "rtt": self.rtt.snapshot(),
+            "packets_sent": self.packets_sent,
+            "retransmissions": self.retransmissions,
+            "timeouts": self.timeouts,
+            "fast_retransmits": self.fast_retransmits,
+            "duplicate_acks": self.duplicate_acks,
+            "messages_sent": self.messages_sent,
+            "bytes_sent": self.bytes_sent,
+            "bytes_in_flight": bytes_in_flight,
+            "goodput": self.goodput(),
+            "packets_received": self.packets_received,
+            "duplicate_packets": self.duplicate_packets,
+            "messages_received": self.messages_received,
+            "bytes_received": self.bytes_received,
+        }
@@ -0,0 +1,73 @@
+'''
+This module spreads the packets of a sender over time instead of sending a
+whole window back to back, which at large windows overflows the receive
+buffer of the peer's UDP socket and loses the packets of its own burst.
+'''
+import time
+from typing import Optional
+from rtt_estimator import RttEstimator
+import util
+
+
+class Pacer:
+    '''
+    Token bucket that paces the data packets sent to a single peer.
+
+    The bucket fills at the pacing rate and holds at most burst bytes, so
+    that after a pause no more than burst bytes go out back to back. Every
+    packet takes its size out of it, and a packet that finds it empty waits
+    until it has refilled. The rate is the lower of
+
+        - util.PACING_GAIN windows per smoothed round trip time, if spread
+          is set: the window is spread over the RTT, a little faster so that
+          pacing does not hold the window back itself, and
+        - rate_limit bytes per second, if it is given,
+
+    and pacing only starts with the first RTT sample when there is no
+    rate_limit.
+
+    Like the RttEstimator, it is shared by every ReliableMessageSender
+    talking to the same receiver address. It is only used from the event
+    loop of the socket, or the one thread sending a message.
+    '''
+
+    def __init__(self, rtt_estimator: RttEstimator, spread: bool = True,
+                 rate_limit: float = None,
+                 burst: int = util.PACING_BURST * util.MAX_DATAGRAM_SIZE):
+        self.rtt = rtt_estimator
+        self.spread = spread
+        self.rate_limit = rate_limit
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.time()
+
+    def rate(self, window: int) -> Optional[float]:
+        '''
+        Returns the pacing rate in bytes per second for a window of window
+        bytes, or None if packets are not paced for now.
+        '''
+        rate = self.rate_limit
+        srtt = self.rtt.srtt
+        if self.spread and srtt:
+            spread = util.PACING_GAIN * window / srtt
+            rate = spread if rate is None else min(rate, spread)
+        return rate
+
+    def delay(self, size: int, window: int) -> float:
+        '''
+        Takes a packet of size bytes out of the bucket and returns 0 if it
+        may be sent now, with a window of window bytes. Otherwise returns the
+        seconds until it may be sent, and takes nothing.
+        '''
+        rate = self.rate(window)
+        if rate is None:
+            return 0.0
+        now = time.time()
+        self.tokens = min(self.tokens + (now - self.updated) * rate, self.burst)
+        self.updated = now
+        if self.tokens < 0:
+            return -self.tokens / rate
+        # a packet larger than what is left puts the bucket in debt, which
+        # the next packet waits out
+        self.tokens -= size
+        return 0.0
@@ -0,0 +1,86 @@
+'''
+This module puts the chunks of a message back in order on the receiving side.
+'''
+import util
+
+
+class ReassemblyBuffer:
+    '''
+    Reassembles the chunks of a message from data packets that may arrive out
+    of order or more than once.
+
+    Chunks that extend the in-order prefix are appended to a list, so the
+    cumulative ACK only moves forward and every chunk is handled a constant
+    number of times. Chunks that arrive ahead of a hole wait in a dict keyed by
+    sequence number until the hole is filled. The message is built with a
+    single join once it is complete.
+    '''
+
+    def __init__(self, first_seq_no: int):
+        self.first_seq_no = first_seq_no
+        # sequence number of the first missing chunk, i.e. the cumulative ACK
+        self.next_seq_no = first_seq_no
+        self.highest_seq_no = first_seq_no - 1
+        self.chunks = []
+        self.out_of_order = dict()
+
+    def add(self, seq_no: int, chunk: str) -> bool:
+        '''
+        Stores a chunk. Returns False if it is a duplicate of a chunk that is
+        already held.
+        '''
+        if seq_no < self.next_seq_no or seq_no in self.out_of_order:
+            return False
+        self.highest_seq_no = max(self.highest_seq_no, seq_no)
+        if seq_no != self.next_seq_no:
+            self.out_of_order[seq_no] = chunk
+            return True
+
+        self.chunks.append(chunk)
+        self.next_seq_no += 1
+        while self.next_seq_no in self.out_of_order:
+            self.chunks.append(self.out_of_order.pop(self.next_seq_no))
+            self.next_seq_no += 1
+        return True
+
+    def cumulative_ack(self) -> int:
+        '''
+        Returns the sequence number up to which (exclusive) every chunk has
+        been received.
+        '''
+        return self.next_seq_no
+
+    def sack_ranges(self, limit: int = util.MAX_SACK_BLOCKS):
+        '''
+        Returns the first limit ranges [first, last) of chunks held above the
+        cumulative ACK. Only the sequence numbers between the cumulative ACK
+        and the highest chunk received are scanned, which the sender's window
+        bounds.
+        '''
+        ranges = []
+        for seq_no in range(self.next_seq_no + 1, self.highest_seq_no + 1):
+            if seq_no not in self.out_of_order:
+                continue
+            if ranges and ranges[-1][1] == seq_no:
+                ranges[-1][1] = seq_no + 1
+            elif len(ranges) < limit:
+                ranges.append([seq_no, seq_no + 1])
+            else:
+                break
+        return ranges
+
+    def take(self):
+        '''
+        Returns the in-order chunks received since the last call and lets go
+        of them, for a receiver that consumes the chunks as they arrive
+        instead of waiting for the whole message.
+        '''
+        chunks, self.chunks = self.chunks, []
+        return chunks
+
+    def message(self, joiner=""):
+        '''
+        Joins the in-order chunks into the message, with "" for str chunks or
+        b"" for bytes-like chunks.
+        '''
+        return joiner.join(self.chunks)
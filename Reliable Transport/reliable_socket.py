@@ -1,9 +1,11 @@
-import socket
-from typing import Dict, Tuple
+import asyncio
+from typing import Dict, Tuple, Union
 from queue import Queue
 from threading import Thread
-from random import randint
-from reliable_transport import ReliableMessageSender, ReliableMessageReceiver
+from concurrent.futures import Future
+from async_socket import AsyncReliableSocket
+from stream import BlockingStreamReader
+import util
 
 Address = Tuple[str, int]
 MsgID = int
@@ -20,33 +22,140 @@ class ReliableSocket:
         ReliableMessageSender and ReliableMessageReceiver are implemented in 
         reliable_transmission.py
 
+        This is a blocking front end to AsyncReliableSocket (async_socket.py):
+        every socket runs a single event loop thread that drives all its
+        senders, receivers and timers, whichever threads call sendto and
+        recvfrom.
+
     APIs:
         ReliableSocket.send(receiver_addr, message)
             Sends a message to an address
+        ReliableSocket.sendto_async(receiver_addr, message)
+            Starts sending a message to an address and returns a future
         ReliableSocket.recvfrom()
             Receives a message sent to the socket
+        ReliableSocket.send_stream(receiver_addr, source)
+            Sends a file or an iterable of pieces to an address as one message
+        ReliableSocket.recv_stream()
+            Receives a stream sent to the socket as it arrives
+        ReliableSocket.stats()
+            Counts the messages the socket keeps state for
+        ReliableSocket.metrics()
+            Reports the RTT, retransmissions and goodput of every peer
+
+    Options:
+        selective_repeat (bool):
+            Ask receivers for SACK ranges and only retransmit the packets they
+            are missing instead of the whole window. Defaults to False.
+        congestion_control (bool):
+            Grow and shrink the number of packets in flight to each peer with
+            the losses on its path (slow start, AIMD, fast retransmit), never
+            going beyond window_size. Defaults to True.
+        wire_format (str):
+            "text" for the original `s:<msg_id>:<type>|<seq>|<body>|<checksum>`
+            packets, or "binary" for a fixed 16 byte header followed by the
+            raw payload, which is cheaper to build and parse and can carry
+            bytes messages. This only picks the format messages are sent in:
+            incoming messages in either format are accepted, and are
+            acknowledged in the format they arrived in. Defaults to "text".
+        max_in_flight (int):
+            The number of messages the socket sends at the same time. Further
+            sendto_async calls queue up until one of them is done. Defaults to
+            util.MAX_IN_FLIGHT_MESSAGES.
+        sessions (bool):
+            Send all the messages to a peer inside one start/end handshake
+            (see ReliableSessionSender) instead of one per message, so that
+            a message only waits for the start packet's round trip if there
+            is no session yet. Messages to a peer then arrive in the order
+            they were sent. A session is closed after util.SESSION_IDLE_TIME
+            seconds without messages. Defaults to False.
+        max_datagram_size (int):
+            The largest datagram sent, headers included. Data packets are
+            filled up to it, measuring text in UTF-8. The default,
+            util.MAX_DATAGRAM_SIZE, fits an Ethernet MTU without
+            fragmentation; raising it needs receivers with a larger bufsize.
+        probe_mtu (bool):
+            Ask the kernel for the MTU of the path to each peer (Linux only)
+            and send smaller datagrams to peers behind a smaller MTU, such as
+            a tunnel. Never goes beyond max_datagram_size. Defaults to False.
+        fec (int):
+            Follow every fec data packets of a message with a parity packet
+            from which the receiver rebuilds any one of them that is lost,
+            without waiting for its retransmission (see fec.py). This costs a
+            packet in every fec + 1, and 4 bytes of every data packet (a
+            quarter of it in the text format, which sends parity packets in
+            base64). 0 turns it off. Defaults to 0.
+        compression (str):
+            "zlib" or "lzma" to compress every message of
+            util.COMPRESSION_THRESHOLD bytes or more that it makes smaller,
+            such as text files, before it is split into packets. The
+            receiver is told by the start packet, so only the sender needs
+            the option. Messages sent in sessions and streams are not
+            compressed. Defaults to None.
+        delayed_acks (bool):
+            Acknowledge in-order data packets util.ACK_EVERY at a time
+            instead of one by one, cutting the ACKs this socket sends as a
+            receiver. An ACK is never held back past the packets that arrived
+            together with its data, and out-of-order and duplicate packets
+            are acknowledged right away, so that losses are still reported
+            at once. Defaults to False.
+        receive_buffer (int):
+            The bytes (characters of text messages) of received data the
+            socket holds for its reader: the messages being reassembled and
+            the complete messages recvfrom has not returned yet. Its free
+            space is advertised on every ACK, and senders keep no more than
+            that in flight, so a reader that falls behind slows its senders
+            down instead of the socket buffering without bound. It should
+            hold several datagrams of max_datagram_size. While there is no
+            message to read, the messages being reassembled may exceed it so
+            that they can complete. Defaults to None, for no limit and no
+            advertised window. Streams are not held in it: each advertises
+            the space left in its reader instead, with or without it (see
+            recv_stream).
+        pacing (bool):
+            Spread the data packets of a window over the round trip time to
+            its peer, instead of sending them back to back, which at large
+            windows overflows the peer's UDP receive buffer and loses the
+            packets of its own burst (see pacing.py). Up to
+            util.PACING_BURST datagrams still go out back to back. Defaults
+            to False.
+        rate_limits (dict):
+            The bytes per second data packets are sent at, at most, to each
+            address in it, such as {("10.0.0.2", 8000): 1000000}. Applies
+            with or without pacing. Defaults to None, for no limit.
+        metrics_file (str):
+            A file the metrics of the socket (see metrics) are appended to
+            every metrics_interval seconds, as a line of JSON. Defaults to
+            None, for no file.
+        metrics_interval (float):
+            Seconds between two lines of metrics_file. Defaults to
+            util.METRICS_INTERVAL.
     """
-    def __init__(self, dest, port, window_size, bufsize=4096):
-        self.__dest = dest
-        self.__port = port
-        self.__window_size = window_size
-        self.__bufsize = bufsize
-        self.__sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.__sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.__sock.settimeout(None)
-        self.__sock.bind((self.__dest, self.__port))
-
-        self.__senders: Dict[Tuple[Address, MsgID], ReliableMessageSender] = {}
-        self.__receivers: Dict[Tuple[Address, MsgID], ReliableMessageReceiver] = {}
-
+    def __init__(self, dest, port, window_size, bufsize=4096,
+                 selective_repeat=False, congestion_control=True,
+                 wire_format="text", max_in_flight=util.MAX_IN_FLIGHT_MESSAGES,
+                 sessions=False, max_datagram_size=util.MAX_DATAGRAM_SIZE,
+                 probe_mtu=False, fec=0, compression=None, delayed_acks=False,
+                 receive_buffer=None, pacing=False, rate_limits=None,
+                 metrics_file=None, metrics_interval=util.METRICS_INTERVAL):
         self.__received_messages = Queue()
+        self.__received_streams = Queue()
 
-        # start the thread for receiving packets
-        Thread(target=self.__receive_handler, args=(), daemon=True).start()
+        # start the thread running the event loop of the socket
+        self.__loop = asyncio.new_event_loop()
+        Thread(target=self.__loop.run_forever, args=(), daemon=True).start()
+
+        self.__engine: AsyncReliableSocket = self.__run(self.__make_engine(
+            dest, port, window_size, bufsize, selective_repeat,
+            congestion_control, wire_format, max_in_flight, sessions,
+            max_datagram_size, probe_mtu, fec, compression, delayed_acks,
+            receive_buffer, pacing, rate_limits, metrics_file,
+            metrics_interval))
+        self.__flow_control = receive_buffer is not None
 
     def recvfrom(self,
                  block: int = True,
-                 timeout: int = None) -> Tuple[str, Address]:
+                 timeout: int = None) -> Tuple[Union[str, bytes], Address]:
         """
         Returns a reliably received message on the socket.
 
@@ -59,9 +168,9 @@ class ReliableSocket:
                 Defaults to None.
 
         Returns:
-            Tuple[str, Address]:
+            Tuple[Union[str, bytes], Address]:
                 A tuple of
-                    (i)  the received message, and
+                    (i)  the received message (bytes if it was sent as bytes), and
                     (ii) the address from where the message is received from
 
         Note:
@@ -73,15 +182,19 @@ class ReliableSocket:
             raise the queue.Empty exception (timeout is ignored in that case).
         """
 
-        return self.__received_messages.get(block=block, timeout=timeout)
+        message, sender_addr = self.__received_messages.get(block=block, timeout=timeout)
+        if self.__flow_control:
+            self.__loop.call_soon_threadsafe(self.__engine.release, message)
+        return message, sender_addr
 
-    def sendto(self, receiver_addr: Address, message: str):
+    def sendto(self, receiver_addr: Address, message: Union[str, bytes]):
         """
         Send message to an address reliably.
 
         Args:
             receiver_addr (Address): Address of destination
-            message (str): Message to send to the destination
+            message (str or bytes): Message to send to the destination. bytes
+                messages need the binary wire format.
 
         Note:
             This function call is syncronous. It blocks until the message is
@@ -89,114 +202,124 @@ class ReliableSocket:
             time).
         """
 
-        self.__send_message_reliably(receiver_addr, message)
+        self.sendto_async(receiver_addr, message).result()
 
-    @staticmethod
-    def __is_from_a_receiver(sender_type: str) -> bool:
-        return sender_type == "r"
+    def sendto_async(self, receiver_addr: Address, message: Union[str, bytes]) -> Future:
+        """
+        Start sending message to an address reliably, without waiting for it.
 
-    @staticmethod
-    def __parse_raw_packet(raw_packet: str) -> Tuple[str, int, str]:
-        raw_packet = raw_packet.split(':')
-        return raw_packet[0], int(raw_packet[1]), ':'.join(raw_packet[2:])
+        Args:
+            receiver_addr (Address): Address of destination
+            message (str or bytes): Message to send to the destination. bytes
+                messages need the binary wire format.
 
-    def __receive_handler(self):
-        """
-        Receives packets on the socket and redirects them to the their particular
-        reliable message sender/receivers.
+        Returns:
+            concurrent.futures.Future:
+                A future that is done once the message has been reliably
+                transported to the destination, and raises the error of the
+                send if it failed.
+
+        Note:
+            Any number of messages can be pending at once; up to max_in_flight
+            of them are sent at the same time and their handshakes overlap.
+            Messages pending at the same time for the same address may arrive
+            in any order, so wait for a message to be done before sending the
+            next one if their order matters.
         """
 
-        while True:
+        return asyncio.run_coroutine_threadsafe(
+            self.__engine.sendto(receiver_addr, message), self.__loop)
 
-            # recieve a packet for a message from a client
-            byte_packet, addr = self.__sock.recvfrom(self.__bufsize)
-            raw_packet = byte_packet.decode("utf-8")
-            sender_type, msg_id, packet = self.__parse_raw_packet(raw_packet)
+    def send_stream(self, receiver_addr: Address, source):
+        """
+        Send a stream to an address reliably, in constant memory.
 
-            if self.__is_from_a_receiver(sender_type):
-                # this belongs to a sender
-                self.__send_to_a_sender(addr, msg_id, packet)
-            else:
-                # this belongs to a receiver
-                self.__send_to_a_receiver(addr, msg_id, packet)
+        Args:
+            receiver_addr (Address): Address of destination
+            source: A file-like object (anything with a read method) or an
+                iterable of str or bytes pieces. bytes need the binary wire
+                format.
 
-    def __send_to_a_sender(self, addr, msg_id: int, ack_packet: str):
-        """
-        Redirects received ack packet to the corresponding message sender
+        Note:
+            This function call is syncronous. The source is read by the event
+            loop of the socket as the window opens, so only the packets in
+            flight are held in memory; see AsyncReliableSocket.send_stream.
         """
 
-        if (addr, msg_id) in self.__senders:
-            sender: ReliableMessageSender = self.__senders[(addr, msg_id)]
-            sender.on_packet_received(ack_packet)
-        else:
-            print("Warning: no sender identified for", (addr, msg_id))
+        self.__run(self.__engine.send_stream(receiver_addr, source))
 
-    def __send_to_a_receiver(self, addr, msg_id: int, packet: str):
-        """
-        Redirects received packet to the corresponding message receiver.
-        If no such receiver is found, a new message receiver is initialized.
+    def recv_stream(self,
+                    block: int = True,
+                    timeout: int = None) -> Tuple[BlockingStreamReader, Address]:
         """
+        Returns a stream sent to the socket as soon as it starts.
+
+        Args:
+            block (bool, optional): Same as for recvfrom.
+            timeout (int, optional): Same as for recvfrom.
+
+        Returns:
+            Tuple[BlockingStreamReader, Address]:
+                A tuple of
+                    (i)  the reader the chunks of the stream are read from (str
+                         for a text stream, bytes for a bytes stream), and
+                    (ii) the address from where the stream is received from
 
-        if not (addr, msg_id) in self.__receivers:
-            # this is a new transmission, set up new receiver
-            self.__setup_new_receiver(addr, msg_id)
+        Note:
+            At most util.STREAM_BUFFER_CHUNKS chunks are held until they are
+            read: the space left for them is advertised as the receive window
+            of the stream, and the sender is held back while it is closed, so
+            the stream should be read while it arrives.
+        """
 
-        receiver: ReliableMessageReceiver = self.__receivers[(addr, msg_id)]
-        receiver.on_packet_received(packet)
+        return self.__received_streams.get(block=block, timeout=timeout)
 
-    def __setup_new_receiver(self, new_addr, msg_id: int):
+    def stats(self) -> Dict[str, int]:
         """
-        Initializes new message receiver.
-        Initialization involves making a queue in which the message receiver can enqueue the message
-        once it is completely (and reliably) received. ReliableSocket needs to start a thread that
-        dequeues this queue to get the completed message.
+        Counts the messages the socket keeps state for. Finished messages are
+        kept for util.LINGER_TIME seconds to answer late duplicates and are
+        deleted afterwards; see AsyncReliableSocket.stats for the counters.
         """
 
-        completed_msg_q: Queue = Queue()
-        self.__receivers[(new_addr, msg_id)] = ReliableMessageReceiver(
-            self.__sock, new_addr, msg_id, completed_msg_q)
+        return self.__run(self.__get_stats())
 
-        Thread(target=self.__process_completed_message,
-               args=(new_addr, completed_msg_q),
-               daemon=True).start()
+    async def __get_stats(self) -> Dict[str, int]:
+        return self.__engine.stats()
 
-    def __process_completed_message(self, sender_addr, completed_msg_q: Queue):
+    def metrics(self) -> Dict[Address, Dict[str, object]]:
         """
-        Waits for a completed message to be received by a reliable message receiver
-        and then processes it
+        Reports the round trip times, retransmissions, duplicates, bytes in
+        flight and goodput of every peer; see AsyncReliableSocket.metrics for
+        the counters.
         """
 
-        # blocks here for message
-        received_msg = completed_msg_q.get()
+        return self.__run(self.__get_metrics())
 
-        # act on completed message
-        self.__received_messages.put((received_msg, sender_addr))
+    async def __get_metrics(self) -> Dict[Address, Dict[str, object]]:
+        return self.__engine.metrics()
 
-        # # delete this message receiver (as its of no use now, message has been completely received)
-        # del self.__receivers[(sender_addr, msg_id)]
+    async def __make_engine(self, *args) -> AsyncReliableSocket:
+        return AsyncReliableSocket(*args, on_message=self.__on_message,
+                                   on_stream=self.__on_stream)
 
-    def __get_unique_msg_id(self, recvr_addr):
-        msg_id = randint(50000, 99999)
-        while (recvr_addr, msg_id) in self.__senders:
-            msg_id = randint(50000, 99999)
-        return msg_id
-
-    def __send_message_reliably(self, recvr_addr, message):
+    def __on_message(self, message, sender_addr):
         """
-        Sends a message reliably.
-        - Initializes a reliable message sender instance that can reliably send this message.
-        - Stores this in a dictionary so that we can send acks to it from our receive_handler.
-        - Notiifies the reliable message sender to start sending.
-        - Deletes the reliable message sender instance as the message has been completey sent. 
+        Queues a completed message for recvfrom.
         """
 
-        msg_id = self.__get_unique_msg_id(recvr_addr)
+        self.__received_messages.put((message, sender_addr))
 
-        sender = ReliableMessageSender(self.__sock, recvr_addr, msg_id,
-                                       self.__window_size)
+    def __on_stream(self, reader, sender_addr):
+        """
+        Queues a stream that has started for recv_stream.
+        """
 
-        self.__senders[(recvr_addr, msg_id)] = sender
+        self.__received_streams.put((BlockingStreamReader(reader, self.__loop), sender_addr))
 
-        sender.send_message(message)
+    def __run(self, coroutine):
+        """
+        Runs a coroutine in the event loop of the socket and waits for its
+        result.
+        """
 
-        # del self.__senders[(recvr_addr, msg_id)]
\ No newline at end of file
+        return asyncio.run_coroutine_threadsafe(coroutine, self.__loop).result()
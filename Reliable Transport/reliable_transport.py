@@ -1,9 +1,21 @@
-from queue import Queue
+from queue import Queue, Empty
+from collections import deque
+from itertools import chain
 from typing import Tuple
 from socket import socket
 import random
 import util
 import time 
+from rtt_estimator import RttEstimator
+from congestion_control import CongestionController
+from reassembly import ReassemblyBuffer
+from stream import StreamReader, pieces_of, chunked
+from fec import ParityEncoder, ParityDecoder
+import compression
+from flow_control import ReceiveWindow
+from pacing import Pacer
+from metrics import PeerMetrics
+import codec as wire
 
 Address = Tuple[str, int]
 
@@ -27,25 +39,116 @@ class ReliableMessageSender(MessageSender):
     '''
     This class reliably delivers a message to a receiver.
     You have to implement the send_message and on_packet_received methods.
-    You can use self.send(packet) to send a packet to the receiver.
+    You can use self.send(self.make_packet(...)) to send a packet to the receiver.
     You can add as many helper functions as you want.
     '''
 
     def __init__(self, sock: socket, receiver_addr: Address, msg_id: int,
-                 window_size: int):
+                 window_size: int, rtt_estimator: RttEstimator = None,
+                 selective_repeat: bool = False,
+                 congestion: CongestionController = None,
+                 codec=None, datagram_size: int = util.MAX_DATAGRAM_SIZE,
+                 fec_block_size: int = 0, compression: str = None,
+                 pacer: Pacer = None, metrics: PeerMetrics = None):
         MessageSender.__init__(self, sock, receiver_addr, msg_id)
         '''
         This is the constructor of the class where you can define any class attributes.
         window_size is the size of your message transport window (the number of in-flight packets during message transmission).
+        rtt_estimator holds the retransmission timeout of the receiver; pass the same one to every sender of a receiver to share it between messages.
+        selective_repeat asks the receiver for SACK ranges, so that a timeout only resends the packets the receiver is missing instead of the whole window.
+        congestion, if given, caps the window at its congestion window; like rtt_estimator it is meant to be shared between the senders of a receiver.
+        codec is the wire format packets are sent in (see codec.py); it defaults to the text format.
+        datagram_size is the largest datagram sent, headers included; see codec.probe_datagram_size.
+        fec_block_size, if not 0, follows every fec_block_size data packets with a parity packet from which the receiver rebuilds any one of them that is lost (see fec.py).
+        compression, if given, is the method ("zlib" or "lzma") messages of util.COMPRESSION_THRESHOLD bytes or more are compressed with, when that makes them smaller (see compression.py).
+        pacer, if given, spreads the data packets over time instead of sending the window back to back (see pacing.py); like rtt_estimator it is meant to be shared between the senders of a receiver.
+        metrics counts the RTT samples, the packets sent and retransmitted, the timeouts and the duplicate ACKs (see metrics.py); like rtt_estimator it is meant to be shared.
         Ignore other arguments; they are passed to the parent class.
         You should immediately return from this function and not block.
         '''
         self.started_bool = False
         self.qu = Queue()
         self.window_size = window_size
-        
+        self.rtt = rtt_estimator if rtt_estimator is not None else RttEstimator()
+        # first transmission time of every packet, and the last retransmission time of the packets sent more than once (Karn's rule)
+        self.sent_at = dict()
+        self.retransmitted = dict()
+        self.selective_repeat = selective_repeat
+        # packets above the cumulative ACK that the receiver reported in SACK ranges
+        self.sacked = set()
+        self.congestion = congestion
+        self.codec = codec if codec is not None else wire.get_codec("text")
+        self.datagram_size = datagram_size
+        self.fec_block_size = fec_block_size
+        self.fec = ParityEncoder(fec_block_size, self.codec.binary) if fec_block_size else None
+        # the parity packet of a block, by the last data packet of the block that it is sent after
+        self.parity = dict()
+        self.compression = compression
+        # the receive window the receiver advertised last, in bytes, if it advertises one
+        self.advertised = None
+        self.pacer = pacer
+        # when the pacer lets the next data packet out, while it holds it back
+        self.pace_at = None
+        self.metrics = metrics if metrics is not None else PeerMetrics()
+        # the phase of the transfer and the length of the message, set by begin
+        self.phase = None
+        self.length = 0
+        # the exception the transfer failed with, once it is done
+        self.error = None
+        self.sock = sock
+        self.receiver_addr = receiver_addr
+        self.msg_id = msg_id
 
-    def on_packet_received(self, packet: str):
+    def make_packet(self, p_type: str, seq_no: int, body=""):
+        '''
+        Builds a packet of this message in the sender's wire format.
+        '''
+        return self.codec.encode(wire.SENDER, self.msg_id, p_type, seq_no, body)
+
+    def send(self, packet):
+        '''
+        Sends a packet built by make_packet to the receiver.
+        '''
+        wire.send_datagram(self.sock, packet, self.receiver_addr)
+
+    def payload_size(self, last_seq_no: int) -> int:
+        '''
+        Returns the bytes of body that fit in a data packet of datagram_size
+        bytes, for sequence numbers up to last_seq_no.
+        '''
+        size = self.datagram_size - self.codec.overhead(self.msg_id, last_seq_no)
+        if self.fec is not None:
+            # the parity packets have to fit as well
+            size = self.fec.chunk_size(size)
+        return size
+
+    def add_data(self, seq_no: int, chunk):
+        '''
+        Makes the data packet of a chunk, and the parity packet of its block
+        if the chunk completes one.
+        '''
+        self.pack_dict[seq_no] = self.make_packet("data",seq_no,chunk)
+        if self.fec is not None:
+            self.add_parity(self.fec.add(seq_no, chunk))
+
+    def end_block(self):
+        '''
+        Makes the parity packet of the chunks added since the last block, for
+        when no chunk follows them for now.
+        '''
+        if self.fec is not None:
+            self.add_parity(self.fec.flush())
+
+    def add_parity(self, block):
+        '''
+        Queues the parity packet of a (first, last, body) block returned by
+        the ParityEncoder, to follow the first transmission of its last packet.
+        '''
+        if block is not None:
+            first, last, body = block
+            self.parity[last] = self.make_packet("parity",first,body)
+
+    def on_packet_received(self, packet):
         '''
         TO BE IMPLEMENTED BY STUDENTS
 
@@ -57,14 +160,28 @@ class ReliableMessageSender(MessageSender):
         You should immediately return from this method and not block.
         '''
 
-        if util.validate_checksum(packet):
-            p_type, p_seq_no, p_data, p_checksum = util.parse_packet(packet)
-            if p_type == "ack":
-                # print("putting ack into queue: ", p_seq_no)
-                self.qu.put(int(p_seq_no))
-            else:
-                print("Should not be getting any other type")
+        ack = self.parse_ack(packet)
+        if ack is not None:
+            # print("putting ack into queue: ", ack)
+            self.qu.put(ack)
 
+    def parse_ack(self, packet):
+        '''
+        Returns (sequence_number, sack_ranges, window, reset) of a valid ACK
+        packet, or None. window is the receive window it advertises, or None;
+        reset is set if the receiver has no state for the message.
+        '''
+        parsed = self.codec.parse(packet)
+        if parsed is None:
+            return None
+        p_type, p_seq_no, p_data = parsed
+        if p_type != "ack":
+            print("Should not be getting any other type")
+            return None
+        options = util.parse_options(p_data)
+        window = options.get("wnd")
+        return p_seq_no, util.parse_ranges(options.get("sack", "")), \
+            None if window is None else int(window), options.get("rst", False)
 
     def send_message(self, message: str):
         ''''
@@ -75,87 +192,603 @@ class ReliableMessageSender(MessageSender):
         You can send a packet to the receiver by calling self.send(...).
 
         Sender's logic:
-        1) Break down the message into util.CHUNK_SIZE sized chunks.
+        1) Break down the message into chunks that fill a datagram of datagram_size bytes.
         2) Choose a random sequence number to start the communication from.
         3) Reliably send a start packet. (i.e. wait for its ACK and resend the packet if the ACK is not received within util.TIME_OUT seconds.)
         4) Send out a window of data packets and wait for ACKs to slide the window appropriately.
         5) How to slide the window? Suppose that the current window starts at sequence number j. If you receive an ACK of sequence number k, such that k > j, send the subsequent k - j number of chunks. Note that the window now starts from sequence number j + (k - j).
         6) If you receive no ACKs for util.TIME_OUT seconds, resend all the packets in the current window.
         7) Once all the chunks have been reliably sent, reliably send an end packet.
+
+        The logic itself lives in begin, on_ack and on_timeout so that an
+        event loop can drive many senders at once (see AsyncReliableSocket);
+        this method drives a single sender from the ACK queue.
         '''
 
-        # Make n packets, each of size util.CHUNK_SIZE. 1 byte = 1 char
+        self.begin(message)
+        while not self.done:
+            ack = self.wait_for_ack(self.next_timer())
+            if ack is None:
+                self.on_timer()
+            else:
+                self.on_ack(*ack)
+        if self.error is not None:
+            raise self.error
 
-        n = util.CHUNK_SIZE
-        chunks = [message[i:i+n] for i in range(0, len(message), n)]
+    def begin(self, message):
+        '''
+        Chunks the message and sends the start packet. From here on the
+        transfer advances through on_ack and on_timer, the latter being due
+        at next_timer(), until self.done is set.
+        '''
+
+        # Make packets that fill datagram_size bytes once their headers are
+        # added. The text format measures its chunks in UTF-8 so that
+        # multibyte characters cannot push a datagram past the limit; the
+        # binary format sends UTF-8 (or the raw bytes of a bytes message) and
+        # slices it without copying.
+
+        raw = isinstance(message, (bytes, bytearray, memoryview))
+        if self.codec.binary:
+            message = memoryview(message if raw else message.encode("utf-8"))
+        elif raw:
+            raise TypeError("bytes messages need the binary wire format")
+        self.length = len(message)
+
+        method = None
+        if self.compression is not None and len(message) >= util.COMPRESSION_THRESHOLD:
+            body = compression.compress(message if self.codec.binary else message.encode("utf-8"),
+                                        self.compression, self.codec.binary)
+            if body is not None:
+                method = self.compression
+                message = memoryview(body) if self.codec.binary else body
 
         initial = random.randint(1, 1000)
-        pack_dict = dict()
-        sent_dict = dict()
+        # there are fewer chunks than characters, which bounds the sequence numbers
+        chunks = util.split_payload(message, self.payload_size(initial + len(message) + 1))
+
+        self.pack_dict = dict()
 
         i = 1
         for chunk in chunks:
-            pack_dict[initial+i] = (util.make_packet("data",initial+i,chunk))
-            sent_dict[initial+i] = False
+            self.add_data(initial+i, chunk)
             i += 1
-            
+        self.end_block()
+
         message_size = len(chunks)
+        end_seq = initial + message_size + 1
 
-        start_packet = util.make_packet("start",initial)
-        # print("Before sending start")
-        while self.qu.empty() :
-            self.send(start_packet)
-            time.sleep(util.TIME_OUT)
+        self.initial = initial
+        self.end_seq = end_seq
+        self.start_packet = self.make_packet("start",initial,
+                                             util.make_options({"sack": self.selective_repeat,
+                                                                "bytes": raw,
+                                                                "fec": self.fec_block_size or None,
+                                                                "compress": method}))
+        self.end_packet = self.make_packet("end",end_seq)
 
-        self.qu = Queue()
-        # print("Window size is ",self.window_size)
-        # print("Before sending data:", pack_dict.keys())
-        current_pack = initial+1
-        while self.ongoing_check(sent_dict):
-            # print("current packet: ",current_pack)
-            self.send_window(pack_dict,current_pack)
-            sent_dict,current_pack  = self.update_sent_dict(sent_dict,current_pack)
+        # The window is [base, base + get_window()). It is clocked by the ACKs
+        # themselves: every cumulative ACK that moves base forward immediately
+        # releases the newly opened slots. When no progress has been made for
+        # one retransmission timeout, next_seq goes back to base so that the
+        # window is sent again (skipping SACKed packets). util.DUP_ACK_THRESHOLD
+        # duplicate ACKs resend the missing packet right away; recover stops
+        # the duplicates caused by that resend from triggering another one.
+        self.base = initial + 1
+        self.next_seq = self.base
+        self.recover = self.base - 1
+        self.dup_acks = 0
 
+        self.phase = "start"
+        self.done = False
+        self.transmit(initial, self.start_packet)
+        self.deadline = time.time() + self.rtt.timeout()
 
-        # print("Before sending end: ",current_pack, initial + message_size+ 1)
-        end_packet = util.make_packet("end",initial + message_size+ 1)
-        self.qu = Queue()
-        while self.qu.empty() :
-            self.send(end_packet)
-            time.sleep(util.TIME_OUT)
+    def on_ack(self, ack: int, sack_ranges=(), window: int = None,
+               reset: bool = False):
+        '''
+        Advances the transfer with an ACK from the receiver. ACKs left over
+        from an earlier phase of the message are ignored. ACKs that change the
+        receive window, or answer probes of a closed one, are not duplicate
+        ACKs. A reset is handed to on_reset.
+        '''
+        if reset:
+            self.on_reset()
+            return
+        window_update = window is not None and window != self.advertised
+        if window is not None:
+            self.advertised = window
 
-        # print("After sending end")
+        if self.phase == "start":
+            if ack > self.initial:
+                self.sample_rtt(self.initial, ack)
+                self.phase = "data"
+                self.deadline = time.time() + self.rtt.timeout()
+                self.send_next()
 
+        elif self.phase == "data":
+            if sack_ranges or self.sacked:
+                for first, last in sack_ranges:
+                    self.sacked.update(range(max(first, ack), last))
+                self.sacked = {seq_no for seq_no in self.sacked if seq_no >= ack}
 
-    def send_window(self,msg_dict,start_index):
+            if ack > self.base:
+                self.sample_rtt(self.base, ack)
+                if self.congestion is not None:
+                    self.congestion.on_ack(min(ack, self.end_seq) - self.base)
+                self.base = min(ack, self.end_seq)
+                self.next_seq = max(self.next_seq, self.base)
+                self.dup_acks = 0
+                self.deadline = time.time() + self.rtt.timeout()
+            elif ack == self.base and self.next_seq > self.base and \
+                    not window_update and self.get_window() > 0:
+                self.dup_acks += 1
+                self.metrics.duplicate_acks += 1
+                if self.dup_acks == util.DUP_ACK_THRESHOLD and self.base > self.recover:
+                    self.metrics.fast_retransmits += 1
+                    if self.congestion is not None:
+                        self.congestion.on_loss()
+                    self.fast_retransmit(self.pack_dict, self.base, self.next_seq)
+                    self.recover = self.next_seq - 1
+                    self.deadline = time.time() + self.rtt.timeout()
+            elif window_update:
+                # the packets the window lets out are timed from now
+                self.deadline = time.time() + self.rtt.timeout()
+            self.send_next()
 
-        for i in range(0,self.window_size):
-            if (start_index+i) in msg_dict.keys():
-                self.send(msg_dict[start_index+i])
+        elif self.phase == "end":
+            if ack > self.end_seq:
+                self.sample_rtt(self.end_seq, ack)
+                self.phase = "done"
+                self.done = True
 
-    def ongoing_check(self,sent_dict):
-        # print("sent_dict :",sent_dict)
-        for element in sent_dict.values():
-            if element == False:
-                return True
+    def on_reset(self):
+        '''
+        Handles a receiver that has no state for the message, having been
+        restarted or having dropped it: a message whose data is being sent is
+        sent again from its start packet. Once all its data has been
+        acknowledged, there is no telling whether the receiver delivered it
+        before forgetting it, and the transfer fails.
+        '''
+        if self.phase == "data":
+            self.phase = "start"
+            self.base = self.next_seq = self.initial + 1
+            self.recover = self.initial
+            self.dup_acks = 0
+            self.sacked = set()
+            self.advertised = None
+            self.pace_at = None
+            self.transmit(self.initial, self.start_packet)
+            self.deadline = time.time() + self.rtt.timeout()
+        elif self.phase == "end":
+            self.fail(ConnectionResetError(
+                "the receiver forgot the message before acknowledging its end"))
 
-        return False
+    def fail(self, error: Exception):
+        '''
+        Ends the transfer with an error, which sendto raises.
+        '''
+        self.error = error
+        self.phase = "failed"
+        self.done = True
 
-    def update_sent_dict(self,sent_dict,curr_pack):
-        time.sleep(util.TIME_OUT)
-        y = curr_pack
+    def next_timer(self) -> float:
+        '''
+        Returns when on_timer is due: at self.deadline, or sooner when the
+        pacer holds packets back.
+        '''
+        if self.pace_at is None:
+            return self.deadline
+        return min(self.deadline, self.pace_at)
+
+    def on_timer(self):
+        '''
+        Retransmits once self.deadline has passed, or sends the packets the
+        pacer held back once it lets them out.
+        '''
+        now = time.time()
+        if now >= self.deadline:
+            self.on_timeout()
+        elif self.pace_at is not None and now >= self.pace_at:
+            self.send_next()
+
+    def on_timeout(self):
+        '''
+        Retransmits after no progress has been made until self.deadline.
+        '''
+        self.rtt.on_timeout()
+        self.metrics.timeouts += 1
+        if self.phase == "start":
+            self.transmit(self.initial, self.start_packet)
+        elif self.phase == "data" and self.get_window() == 0:
+            # the receiver has no space: probe it with the start packet, which
+            # it acknowledges with its window, in case the ACK that opened the
+            # window again was lost
+            self.transmit(self.initial, self.start_packet)
+        elif self.phase == "data":
+            if self.congestion is not None:
+                self.congestion.on_loss()
+            self.recover = self.next_seq - 1
+            self.next_seq = self.base
+            self.dup_acks = 0
+            self.send_next()
+        elif self.phase == "end":
+            self.transmit(self.end_seq, self.end_packet)
+        self.deadline = time.time() + self.rtt.timeout()
+
+    def send_next(self):
+        '''
+        Fills the window with the packets not sent yet, as fast as the pacer
+        lets them out, or sends the end packet once every data packet has
+        been acknowledged.
+        '''
+        self.pace_at = None
+        if self.base >= self.end_seq:
+            self.phase = "end"
+            self.transmit(self.end_seq, self.end_packet)
+            self.deadline = time.time() + self.rtt.timeout()
+            return
 
-        if not self.qu.empty():
-            x = max(list(self.qu.queue))
-            # print("Found max cum ack = ", x)
-            y = x
-            for key in sent_dict.keys():
-                if key < x:
-                    sent_dict[key] = True
+        window = self.get_window()
+        while self.next_seq < self.end_seq and self.next_seq < self.base + window:
+            if self.next_seq not in self.sacked:
+                if not self.pace(window):
+                    return
+                self.transmit(self.next_seq, self.pack_dict[self.next_seq])
+            self.next_seq += 1
 
+    def pace(self, window: int) -> bool:
+        '''
+        Tells whether the pacer lets the next data packet out now, with a
+        window of window packets. If it does not, self.pace_at is set to when
+        it does.
+        '''
+        if self.pacer is None:
+            return True
+        # counting every packet as a full datagram, like get_window
+        wait = self.pacer.delay(self.datagram_size, window * self.datagram_size)
+        if wait > 0:
+            self.pace_at = time.time() + wait
+            return False
+        return True
 
-        return sent_dict, y
+    def transmit(self, seq_no: int, packet):
+        '''
+        Sends a packet and records when it was first sent, so that its ACK can
+        be used as an RTT sample. The first time the last packet of an FEC
+        block is sent, the parity packet of the block follows it.
+        '''
+        if seq_no in self.sent_at:
+            self.retransmitted[seq_no] = time.time()
+            self.metrics.retransmissions += 1
+        else:
+            self.sent_at[seq_no] = time.time()
+        self.metrics.packets_sent += 1
+        self.send(packet)
+        if seq_no in self.parity:
+            self.send(self.parity.pop(seq_no))
 
+    def sample_rtt(self, base: int, ack: int):
+        '''
+        Feeds the round trip time of the last packet acknowledged by ack to
+        the RTT estimator. If any of the packets in [base, ack) that the ACK
+        newly acknowledges has been retransmitted, the ACK may have been
+        triggered by that retransmission and is not sampled.
+        '''
+        self.rtt.on_progress()
+        seq_no = ack - 1
+        now = time.time()
+        if seq_no not in self.sent_at:
+            return
+        retransmissions = [self.retransmitted[i] for i in range(base, ack)
+                           if i in self.retransmitted]
+        if retransmissions and \
+                not self.rtt.is_spurious(now - max(retransmissions)):
+            return
+        self.rtt.sample(now - self.sent_at[seq_no])
+        self.metrics.rtt.add(now - self.sent_at[seq_no])
+
+    def wait_for_ack(self, deadline: float):
+        '''
+        Blocks on the ACK queue until an ACK arrives or the deadline passes.
+        Returns (sequence_number, sack_ranges, window, reset) of the ACK, as
+        parse_ack does and on_ack takes them, or None on timeout.
+        '''
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            return None
+        try:
+            return self.qu.get(timeout=remaining)
+        except Empty:
+            return None
+
+    def get_window(self) -> int:
+        '''
+        Returns the number of packets that may be in flight: window_size,
+        further limited by the congestion window if there is one, and by the
+        receive window if the receiver advertises one.
+        '''
+        window = self.window_size
+        if self.congestion is not None:
+            window = min(window, self.congestion.window())
+        if self.advertised is not None:
+            # counting every packet as a full datagram, and letting at least
+            # one through a window that is open at all
+            window = min(window, -(-self.advertised // self.datagram_size))
+        return window
+
+    def bytes_in_flight(self) -> int:
+        '''
+        Returns the bytes of the data packets sent and not acknowledged yet,
+        headers included.
+        '''
+        if self.phase != "data":
+            return 0
+        return sum(len(part) for seq_no in range(self.base, self.next_seq)
+                   if seq_no not in self.sacked
+                   for part in self.pack_dict[seq_no])
+
+    def release_acked(self):
+        '''
+        Forgets the packets below base, for the senders that outlive their
+        packets. self.released is where the last call stopped.
+        '''
+        for seq_no in range(self.released, self.base):
+            self.pack_dict.pop(seq_no, None)
+            self.sent_at.pop(seq_no, None)
+            self.retransmitted.pop(seq_no, None)
+        self.released = max(self.released, self.base)
+
+    def fast_retransmit(self, msg_dict, start_index, end_index):
+        '''
+        Resends the packet at start_index that the receiver keeps asking for.
+        In selective repeat mode every other hole below the highest SACKed
+        packet in [start_index, end_index) is resent as well.
+        '''
+        last = max(self.sacked, default=start_index)
+        for seq_no in range(start_index, min(last, end_index - 1) + 1):
+            if seq_no not in self.sacked:
+                self.transmit(seq_no, msg_dict[seq_no])
+
+
+
+class ReliableSessionSender(ReliableMessageSender):
+    '''
+    This class reliably delivers any number of messages to a receiver inside
+    a single start/end handshake, so that only the first message to a peer
+    waits for a round trip before its data is sent.
+
+    Each message is framed as "<length>:<message>", or "<length>b:<message>"
+    for a bytes message, where the length counts the characters (or bytes)
+    of the message, and is split into packets on its own so that it starts a new data
+    packet. The sequence numbers of the session run on from one message to
+    the next, so the window, the SACK ranges and the retransmissions all
+    work across message boundaries.
+
+    The session is closed with the end packet once no message has been
+    pushed for idle_time seconds; a closing session takes no more messages.
+    A session whose receiver answers with a reset, having lost its state, is
+    closed at once, and the messages it had not delivered are left in
+    undelivered for the socket to push again in a new session.
+    '''
+
+    def __init__(self, sock: socket, receiver_addr: Address, msg_id: int,
+                 window_size: int, rtt_estimator: RttEstimator = None,
+                 selective_repeat: bool = False,
+                 congestion: CongestionController = None,
+                 codec=None, datagram_size: int = util.MAX_DATAGRAM_SIZE,
+                 fec_block_size: int = 0, pacer: Pacer = None,
+                 metrics: PeerMetrics = None,
+                 idle_time: float = util.SESSION_IDLE_TIME):
+        ReliableMessageSender.__init__(self, sock, receiver_addr, msg_id,
+                                       window_size, rtt_estimator,
+                                       selective_repeat, congestion, codec,
+                                       datagram_size, fec_block_size,
+                                       pacer=pacer, metrics=metrics)
+        self.idle_time = idle_time
+        # (sequence number after the last packet, message, callback) of every message not acknowledged yet
+        self.deliveries = deque()
+        # (message, callback) of the messages not delivered by a reset session
+        self.undelivered = []
+        self.closing = False
+        self.released = 0
+
+    def open(self):
+        '''
+        Sends the start packet of the session. Messages may be pushed right
+        away; their data follows as soon as the start packet is acknowledged.
+        '''
+        initial = random.randint(1, 1000)
+        self.initial = initial
+        self.pack_dict = dict()
+        self.end_seq = initial + 1
+        self.start_packet = self.make_packet("start",initial,
+                                             util.make_options({"sack": self.selective_repeat,
+                                                                "session": True,
+                                                                "fec": self.fec_block_size or None}))
+        self.base = initial + 1
+        self.next_seq = self.base
+        self.recover = self.base - 1
+        self.dup_acks = 0
+        self.released = initial
+
+        self.phase = "start"
+        self.done = False
+        self.transmit(initial, self.start_packet)
+        self.deadline = time.time() + self.rtt.timeout()
+
+    def push(self, message, on_delivered):
+        '''
+        Queues a message behind the ones already pushed. on_delivered is
+        called without arguments once the receiver has acknowledged all of it.
+        '''
+        frame = self.frame(message)
+        idle = self.base >= self.end_seq
+
+        for chunk in util.split_payload(frame, self.payload_size(self.end_seq + len(frame))):
+            self.add_data(self.end_seq, chunk)
+            self.end_seq += 1
+        # the message does not wait for the next one to be protected
+        self.end_block()
+        self.deliveries.append((self.end_seq, message, on_delivered))
+
+        if self.phase == "data":
+            if idle:
+                self.deadline = time.time() + self.rtt.timeout()
+            self.send_next()
+
+    def frame(self, message):
+        '''
+        Prefixes a message with its length, see the class description.
+        '''
+        raw = isinstance(message, (bytes, bytearray, memoryview))
+        if self.codec.binary:
+            payload = bytes(message) if raw else message.encode("utf-8")
+            header = b"%d%s:" % (len(payload), b"b" if raw else b"")
+            return memoryview(header + payload)
+        if raw:
+            raise TypeError("bytes messages need the binary wire format")
+        return "%d:" % len(message) + message
+
+    def close(self):
+        '''
+        Sends the end packet once every message pushed so far is delivered.
+        '''
+        self.closing = True
+        if self.phase == "data":
+            self.send_next()
+
+    def on_ack(self, ack: int, sack_ranges=(), window: int = None,
+               reset: bool = False):
+        ReliableMessageSender.on_ack(self, ack, sack_ranges, window, reset)
+        if self.done:
+            return
+        self.release_acked()
+        while self.deliveries and self.deliveries[0][0] <= self.base:
+            _, _, on_delivered = self.deliveries.popleft()
+            on_delivered()
+
+    def on_reset(self):
+        '''
+        Closes the session, leaving the messages it has not delivered in
+        self.undelivered; the receiver has already delivered the others.
+        '''
+        if self.done:
+            # the resets of the other packets in flight
+            return
+        self.undelivered = [(message, on_delivered)
+                            for _, message, on_delivered in self.deliveries]
+        self.deliveries.clear()
+        self.closing = True
+        self.phase = "done"
+        self.done = True
+
+    def on_timeout(self):
+        if self.phase == "data" and self.base >= self.end_seq:
+            # nothing is in flight: the session has been idle for idle_time
+            self.close()
+            return
+        ReliableMessageSender.on_timeout(self)
+
+    def send_next(self):
+        if self.base >= self.end_seq and not self.closing:
+            self.deadline = time.time() + self.idle_time
+            return
+        if self.base >= self.end_seq:
+            self.end_packet = self.make_packet("end",self.end_seq)
+        ReliableMessageSender.send_next(self)
+
+
+class ReliableStreamSender(ReliableMessageSender):
+    '''
+    This class reliably delivers a stream to a receiver: a message that is
+    read from a file-like object or an iterable of str or bytes pieces as the
+    window opens, so that only the packets in flight are held in memory
+    however long the stream is.
+
+    The source is read util.CHUNK_SIZE characters (or bytes) at a time and
+    cut into packets of datagram_size bytes: UTF-8 chunks of a text stream in
+    the text wire format, or bytes of a bytes stream (or of the UTF-8 of a
+    text stream) in the binary one. The receiver hands them to a
+    StreamReader as they arrive.
+    '''
+
+    def begin(self, source):
+        '''
+        Sends the start packet of the stream. Whether it is a bytes stream is
+        decided by its first piece.
+        '''
+        n = util.CHUNK_SIZE
+        pieces = pieces_of(source, n)
+        first = next(pieces, "")
+        raw = isinstance(first, (bytes, bytearray, memoryview))
+        if raw and not self.codec.binary:
+            raise TypeError("bytes streams need the binary wire format")
+        pieces = chain([first], pieces)
+        if self.codec.binary and not raw:
+            pieces = (piece.encode("utf-8") for piece in pieces)
+        # the length of a stream is not known, so its packets are sized for
+        # the largest sequence number of the wire format
+        self.chunks = chunked(pieces, self.payload_size(self.codec.MAX_SEQ_NO))
+        self.exhausted = False
+        # characters (or bytes) read from the source so far
+        self.length = 0
+
+        initial = random.randint(1, 1000)
+        self.initial = initial
+        self.pack_dict = dict()
+        self.end_seq = initial + 1
+        self.start_packet = self.make_packet("start",initial,
+                                             util.make_options({"sack": self.selective_repeat,
+                                                                "stream": True,
+                                                                "bytes": raw,
+                                                                "fec": self.fec_block_size or None}))
+        self.base = initial + 1
+        self.next_seq = self.base
+        self.recover = self.base - 1
+        self.dup_acks = 0
+        self.released = initial
+
+        self.phase = "start"
+        self.done = False
+        self.transmit(initial, self.start_packet)
+        self.deadline = time.time() + self.rtt.timeout()
+
+    def on_ack(self, ack: int, sack_ranges=(), window: int = None,
+               reset: bool = False):
+        ReliableMessageSender.on_ack(self, ack, sack_ranges, window, reset)
+        self.release_acked()
+
+    def on_reset(self):
+        '''
+        Fails the stream: the part of it that has been read from the source
+        and acknowledged is gone, and cannot be sent again.
+        '''
+        if self.phase in ("data", "end"):
+            self.fail(ConnectionResetError("the receiver forgot the stream"))
+
+    def send_next(self):
+        # read just enough of the source to fill the window, and a packet
+        # ahead when the receive window is closed, to probe it with
+        window = max(self.get_window(), 1)
+        while not self.exhausted and self.end_seq < self.base + window:
+            # the end packet and the ACK of it take the two sequence numbers
+            # after the last data packet
+            if self.end_seq + 2 > self.codec.MAX_SEQ_NO:
+                self.fail(OverflowError("the stream ran out of sequence numbers "
+                                        "after %d characters (or bytes)" % self.length))
+                return
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                self.exhausted = True
+                self.end_block()
+            else:
+                self.add_data(self.end_seq, chunk)
+                self.end_seq += 1
+                self.length += len(chunk)
+        if self.base >= self.end_seq:
+            self.end_packet = self.make_packet("end",self.end_seq)
+        ReliableMessageSender.send_next(self)
 
 
 class MessageReceiver:
@@ -183,25 +816,79 @@ class ReliableMessageReceiver(MessageReceiver):
     '''
     This class reliably receives a message from a sender. 
     You have to implement the on_packet_received method. 
-    You can use self.send(packet) to send a packet back to the sender, and will have to call self.on_message_completed(message) when the complete message is received.
+    You can use self.send(self.make_packet(...)) to send a packet back to the sender, and will have to call self.on_message_completed(message) when the complete message is received.
     You can add as many helper functions as you want.
     '''
 
     def __init__(self, sock: socket, sender_addr: Address, msg_id: int,
-                 completed_message_q: Queue):
+                 completed_message_q: Queue, codec=None,
+                 delayed_acks: bool = False,
+                 receive_window: ReceiveWindow = None,
+                 metrics: PeerMetrics = None):
         MessageReceiver.__init__(self, sock, sender_addr, msg_id,
                                  completed_message_q)
         '''
         This is the constructor of the class where you can define any class attributes to maintain state.
+        codec is the wire format of the sender, which the ACKs are sent in; it defaults to the text format.
+        delayed_acks acknowledges in-order data packets util.ACK_EVERY at a time; the ACK of the last ones is sent by flush_ack, which has to be called once the packets that have arrived together are handled. Out-of-order and duplicate packets are acknowledged right away.
+        receive_window, if given, is the receive buffer of the socket: the chunks the receiver holds take up space in it, and its free space is advertised on every ACK (see flow_control.py).
+        metrics counts the packets received, the duplicate data packets and the bytes of data taken (see metrics.py); it is meant to be shared between the senders and receivers of a peer.
         You should immediately return from this function and not block.
         '''
-        self.data_dict = dict()
-        self.seq_list = []
+        self.codec = codec if codec is not None else wire.get_codec("text")
+        self.sock = sock
+        self.sender_addr = sender_addr
+        self.msg_id = msg_id
+        # set when the start packet says the message is bytes rather than text
+        self.raw = False
+        # the method the message was compressed with, if the start packet names one
+        self.compression = None
+        # created by the start packet
+        self.buffer = None
         self.start_pack_no = 0
         self.final_pack_no = 0
+        self.completed = False
+        # set when the start packet asks for SACK ranges on every ACK
+        self.selective_repeat = False
+        # set when the start packet opens a session of framed messages (see ReliableSessionSender)
+        self.session = False
+        # characters (or bytes) still missing from the message being received in a session
+        self.frame_left = 0
+        self.frame_raw = False
+        self.frame_parts = []
+        # the reader a stream is handed to (see ReliableStreamSender), and the
+        # longest chunk of it received so far, which the space left in the
+        # reader is advertised in
+        self.stream = None
+        self.stream_chunk = 0
+        # rebuilds lost data packets from parity packets, when the start packet asks for them
+        self.fec = None
+        self.delayed_acks = delayed_acks
+        # in-order data packets received since the last ACK
+        self.unacked = 0
+        self.receive_window = receive_window
+        # the bytes of the chunks held in receive_window, from the start packet
+        # until the message is complete, the window last advertised, and what
+        # is left of it
+        self.held = None
+        self.advertised = None
+        self.allowance = 0
+        self.metrics = metrics if metrics is not None else PeerMetrics()
         # print("Message reciever intialized")
 
-    def on_packet_received(self, packet: str):
+    def make_packet(self, p_type: str, seq_no: int, body=""):
+        '''
+        Builds a packet of this message in the sender's wire format.
+        '''
+        return self.codec.encode(wire.RECEIVER, self.msg_id, p_type, seq_no, body)
+
+    def send(self, packet):
+        '''
+        Sends a packet built by make_packet to the sender.
+        '''
+        wire.send_datagram(self.sock, packet, self.sender_addr)
+
+    def on_packet_received(self, packet):
         '''
         TO BE IMPLEMENTED BY STUDENTS
 
@@ -219,57 +906,237 @@ class ReliableMessageReceiver(MessageReceiver):
         5) If the packet type is "end", assemble all the stored chunks into a message, call self.on_message_received(message) with the completed message, and send an ACK with the received packet's sequence number + 1.
         '''
 
-        if util.validate_checksum (packet):
-            p_type, p_seq_no, p_data, p_checksum = util.parse_packet(packet)
-            # print("receiver got valid checksum packet with details: ")
-            # print(p_type, p_seq_no, p_data, p_checksum)
-            p_seq_no = int(p_seq_no)
+        parsed = self.codec.parse(packet)
+        if parsed is not None:
+            p_type, p_seq_no, p_data = parsed
+            self.metrics.packets_received += 1
 
             if p_type == "start":
                 
+                if self.completed:
+                    # a late duplicate; the message has been delivered already
+                    self.send(self.make_packet("ack",p_seq_no+1))
+                    return
+                new = self.buffer is None or self.start_pack_no != p_seq_no
+                if new:
+                    self.buffer = ReassemblyBuffer(p_seq_no + 1)
                 self.start_pack_no = p_seq_no
-                first_ack = util.make_packet("ack",p_seq_no+1)
+                options = util.parse_options(p_data)
+                if new and self.receive_window is not None and self.held is None:
+                    self.held = 0
+                    self.receive_window.receivers += 1
+                block_size = int(options.get("fec", 0))
+                if new and block_size:
+                    self.fec = ParityDecoder(block_size, self.codec.binary, p_seq_no + 1)
+                self.selective_repeat = options.get("sack", False)
+                self.raw = options.get("bytes", False)
+                self.compression = options.get("compress")
+                self.session = options.get("session", False)
+                if new and options.get("stream", False):
+                    # a stream is handed over as soon as it starts
+                    self.stream = StreamReader(self.raw, self.codec.binary)
+                    self.stream.on_read = self.on_stream_read
+                    self.on_message_completed(self.stream)
+                first_ack = self.make_packet("ack",p_seq_no+1,util.make_options(self.window_option()))
                 self.send(first_ack)
 
             elif p_type == "end":
+                if self.buffer is None and not self.completed:
+                    self.send_reset(p_seq_no)
+                    return
                 self.final_pack_no = int(p_seq_no)
-                # print("Receiver got end packet, had already gotten: ", self.seq_list)
-                last_ack = util.make_packet("ack",p_seq_no+1)
+                last_ack = self.make_packet("ack",p_seq_no+1)
                 self.send(last_ack)
-                self.on_message_completed(self.get_message())
+                # a retransmitted end packet only needs its ACK again
+                if not self.completed:
+                    self.completed = True
+                    self.release_held()
+                    if self.stream is not None:
+                        self.stream.end()
+                    elif not self.session:
+                        self.on_message_completed(self.get_message())
+                    # only the end packet is answered from now on
+                    self.buffer = None
 
             elif p_type == "data":
-                if p_seq_no not in self.seq_list:
-                    self.seq_list.append(p_seq_no)
-                    self.seq_list.sort()
-                    # print("Receiver got data packet:", p_seq_no)
-                    self.data_dict[p_seq_no] = (p_data)
+                if self.buffer is None:
+                    if not self.completed:
+                        self.send_reset(p_seq_no)
+                    return
+                expected = self.buffer.cumulative_ack()
+                self.on_data(p_seq_no, p_data)
+                if self.fec is not None:
+                    self.recover()
+                # the next packet in order, with no hole left behind it
+                if self.delayed_acks and p_seq_no == expected and \
+                        self.buffer.cumulative_ack() > self.buffer.highest_seq_no:
+                    self.unacked += 1
+                    if self.unacked < util.ACK_EVERY:
+                        return
+                self.send_ack()
 
-                next_ack = util.make_packet("ack",self.get_cumm_ack())
-                self.send(next_ack)
+            elif p_type == "parity":
+                if self.buffer is None or self.fec is None:
+                    return
+                self.fec.add_parity(p_seq_no, p_data)
+                # a parity packet is only answered if it rebuilt a data packet
+                if self.recover():
+                    self.send_ack()
 
             else:
                 print("Should not be getting any other type")
 
-    def get_message(self):
-        mess = ""
-        for i in range(self.start_pack_no + 1, self.final_pack_no):
-            if self.data_dict[i]:
-                mess += self.data_dict[i]
+    def on_data(self, seq_no: int, chunk):
+        '''
+        Stores the chunk of a data packet, received or rebuilt, and hands on
+        the chunks that are in order to a stream or a session.
+        '''
+        if self.stream is not None:
+            # the sender went past the window the reader advertised, or is
+            # probing it while it is closed
+            if self.stream.full():
+                return
+            new = self.buffer.add(seq_no, chunk)
+            if new:
+                self.stream_chunk = max(self.stream_chunk, len(chunk))
+            for in_order in self.buffer.take():
+                self.stream.feed(in_order)
+        elif self.held is not None and self.allowance <= 0 and self.receive_window.full():
+            # turned away until the reader frees space, see flow_control.py
+            return
+        else:
+            new = self.buffer.add(seq_no, chunk)
+            if new and self.held is not None:
+                self.held += len(chunk)
+                self.allowance -= len(chunk)
+                self.receive_window.hold(len(chunk))
+        if new:
+            self.metrics.bytes_received += len(chunk)
+        else:
+            self.metrics.duplicate_packets += 1
+        if self.fec is not None:
+            self.fec.add(seq_no, chunk)
+        if self.session:
+            for in_order in self.buffer.take():
+                if self.held is not None:
+                    self.held -= len(in_order)
+                    self.receive_window.release(len(in_order))
+                self.on_session_chunk(in_order)
 
-        return mess
+    def recover(self) -> bool:
+        '''
+        Stores the data packets that the parity packets received so far
+        rebuild. Returns whether there were any.
+        '''
+        recovered = self.fec.recover(self.buffer.cumulative_ack())
+        for seq_no, chunk in recovered:
+            self.on_data(seq_no, chunk)
+        return bool(recovered)
 
-    def get_cumm_ack(self):
+    def send_reset(self, seq_no: int):
+        '''
+        Tells the sender that the receiver has no state for the message: it
+        got data without a start packet, so the socket has been restarted or
+        has dropped the receiver since. The sender starts over, or fails.
+        '''
+        self.send(self.make_packet("ack",seq_no,util.make_options({"rst": True})))
 
-        # print("sequence list:", self.seq_list)
-        x = self.start_pack_no
-        for element in self.seq_list:
-            if element == x + 1 or element == x:
-                x = element
-            else:
-                break 
+    def send_ack(self):
+        '''
+        Sends the cumulative ACK of the data received so far, with SACK ranges
+        if the sender asked for them.
+        '''
+        cumm_ack = self.buffer.cumulative_ack()
+        options = self.window_option()
+        if self.selective_repeat:
+            options["sack"] = util.make_ranges(self.buffer.sack_ranges())
+        next_ack = self.make_packet("ack",cumm_ack,util.make_options(options))
+        self.send(next_ack)
+        self.unacked = 0
 
-        # print("next ack from sequence ", self.seq_list,"should be: ", x+1)
-        return x+1
+    def window_option(self):
+        '''
+        Returns the ACK option advertising the receive window, if there is one:
+        the space left in the reader of a stream, or the share of the receive
+        buffer of the socket.
+        '''
+        if self.stream is not None:
+            # until the first chunk arrives, a chunk is taken to fill a datagram
+            self.advertised = self.stream.space() * \
+                (self.stream_chunk or util.MAX_DATAGRAM_SIZE)
+            return {"wnd": self.advertised}
+        if self.receive_window is None:
+            return dict()
+        self.advertised = self.allowance = self.receive_window.share()
+        return {"wnd": self.advertised}
+
+    def on_stream_read(self):
+        '''
+        Tells the sender that the window of a stream is open again, once its
+        reader has freed half its space after the window closed. Until then,
+        the sender probes the closed window.
+        '''
+        if self.advertised == 0 and self.buffer is not None and \
+                self.stream.space() >= self.stream.limit // 2:
+            self.send_ack()
 
+    def release_held(self):
+        '''
+        Frees the space the chunks held by the receiver take up in the receive
+        window, once the message is complete or abandoned.
+        '''
+        if self.held is not None:
+            self.receive_window.release(self.held)
+            self.receive_window.receivers -= 1
+        self.held = None
+
+    def flush_ack(self):
+        '''
+        Sends the ACK held back by delayed_acks, if any.
+        '''
+        if self.unacked and self.buffer is not None:
+            self.send_ack()
 
+    def on_session_chunk(self, chunk):
+        '''
+        Collects the next in-order chunk of a session, and completes the
+        message it belongs to once it has all of its length.
+        '''
+        if self.frame_left == 0:
+            # the chunk starts a new message with its "<length>[b]:" header
+            if self.codec.binary:
+                colon = bytes(chunk[:24]).index(b":")
+                header = bytes(chunk[:colon]).decode("ascii")
+            else:
+                colon = chunk.index(":")
+                header = chunk[:colon]
+            self.frame_raw = header.endswith("b")
+            self.frame_left = int(header.rstrip("b"))
+            self.frame_parts = []
+            chunk = chunk[colon+1:]
+
+        self.frame_parts.append(chunk)
+        self.frame_left -= len(chunk)
+        if self.frame_left == 0:
+            if not self.codec.binary:
+                self.on_message_completed("".join(self.frame_parts))
+            else:
+                message = b"".join(self.frame_parts)
+                self.on_message_completed(message if self.frame_raw else message.decode("utf-8"))
+            self.frame_parts = []
+
+    def get_message(self):
+        '''
+        Joins the received chunks into the message: a str, or bytes if the
+        sender sent bytes in the binary format. A compressed message is
+        decompressed.
+        '''
+        if not self.codec.binary:
+            message = self.buffer.message("")
+            if self.compression is None:
+                return message
+            return compression.decompress(message, self.compression).decode("utf-8")
+        message = self.buffer.message(b"")
+        if self.compression is not None:
+            message = compression.decompress(message, self.compression)
+        return message if self.raw else message.decode("utf-8")
@@ -0,0 +1,100 @@
+'''
+This module estimates the retransmission timeout of a peer from the round trip
+times of its ACKs.
+'''
+from threading import Lock
+import time
+import util
+
+
+class RttEstimator:
+    '''
+    Smoothed round trip time estimator for a single peer (RFC 6298).
+
+    The estimate is shared by every ReliableMessageSender talking to the same
+    receiver address, so a new message starts with the timeout learnt by the
+    previous ones instead of util.TIME_OUT.
+
+    Only packets that were transmitted exactly once may be sampled (Karn's
+    rule): the ACK of a retransmitted packet cannot be matched to the
+    transmission that triggered it, unless it arrives sooner after the
+    retransmission than the smallest RTT ever measured, in which case the
+    timeout was spurious and the original transmission is sampled instead.
+
+    Every timeout doubles the RTO, and the backoff is dropped again as soon as
+    an ACK acknowledges new data, even if that ACK cannot be sampled. Messages
+    that are sent at the same time tend to time out together, so the RTO is
+    doubled at most once per backed off RTO.
+    '''
+    ALPHA = 1 / 8
+    BETA = 1 / 4
+    K = 4
+
+    def __init__(self, initial_rto: float = util.TIME_OUT,
+                 min_rto: float = util.MIN_TIME_OUT,
+                 max_rto: float = util.MAX_TIME_OUT):
+        self.srtt = None
+        self.rttvar = None
+        self.min_rtt = None
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.rto = initial_rto
+        self.backoff = 1
+        self.backed_off_at = None
+        self.lock = Lock()
+
+    def sample(self, rtt: float):
+        '''
+        Updates the estimate with the measured round trip time of a packet
+        that was not retransmitted.
+        '''
+        with self.lock:
+            if self.min_rtt is None or rtt < self.min_rtt:
+                self.min_rtt = rtt
+            if self.srtt is None:
+                self.srtt = rtt
+                self.rttvar = rtt / 2
+            else:
+                self.rttvar = (1 - self.BETA) * self.rttvar + \
+                    self.BETA * abs(self.srtt - rtt)
+                self.srtt = (1 - self.ALPHA) * self.srtt + self.ALPHA * rtt
+            self.rto = min(max(self.srtt + self.K * self.rttvar,
+                               self.min_rto), self.max_rto)
+            self.backoff = 1
+            self.backed_off_at = None
+
+    def is_spurious(self, since_retransmission: float) -> bool:
+        '''
+        Tells whether an ACK that arrived since_retransmission seconds after
+        a retransmission was triggered by the original transmission instead.
+        '''
+        with self.lock:
+            return self.min_rtt is not None and since_retransmission < self.min_rtt
+
+    def on_progress(self):
+        '''
+        Drops the exponential backoff once the peer acknowledges new data.
+        '''
+        with self.lock:
+            self.backoff = 1
+            self.backed_off_at = None
+
+    def on_timeout(self):
+        '''
+        Backs the timeout off exponentially after a retransmission.
+        '''
+        with self.lock:
+            now = time.time()
+            if self.backed_off_at is not None and \
+                    now - self.backed_off_at < min(self.rto * self.backoff, self.max_rto):
+                return
+            if self.rto * self.backoff < self.max_rto:
+                self.backoff *= 2
+                self.backed_off_at = now
+
+    def timeout(self) -> float:
+        '''
+        Returns the current retransmission timeout in seconds.
+        '''
+        with self.lock:
+            return min(self.rto * self.backoff, self.max_rto)
@@ -5,20 +5,85 @@ import sys
 import getopt
 import socket
 from threading import Thread
+from typing import Dict, List, Optional, Tuple
 import util
 from reliable_socket import ReliableSocket
 
+Address = Tuple[str, int]
+
+
+class ClientRegistry:
+    '''
+    The clients that are online, indexed both by username and by address so
+    that either is found in constant time. Usernames are kept in the order
+    the clients joined.
+    '''
+
+    def __init__(self):
+        self.by_username: Dict[str, Address] = dict()
+        self.by_address: Dict[Address, str] = dict()
+
+    def add(self, username: str, address: Address) -> bool:
+        '''
+        Adds a client, unless its username is taken. A client that joins
+        again from the same address under a new username gives up its old
+        one. Returns whether it was added.
+        '''
+        if username in self.by_username:
+            return False
+        if address in self.by_address:
+            del self.by_username[self.by_address[address]]
+        self.by_username[username] = address
+        self.by_address[address] = username
+        return True
+
+    def remove(self, username: str, address: Address) -> bool:
+        '''
+        Removes the client of a username, if it is the one at address.
+        Returns whether it was removed.
+        '''
+        if self.by_username.get(username) != address:
+            return False
+        del self.by_username[username]
+        if self.by_address.get(address) == username:
+            del self.by_address[address]
+        return True
+
+    def username(self, address: Address) -> str:
+        '''
+        Returns the username of the client at address, or an empty string.
+        '''
+        return self.by_address.get(address, str())
+
+    def address(self, username: str) -> Optional[Address]:
+        '''
+        Returns the address of the client of a username, or None.
+        '''
+        return self.by_username.get(username)
+
+    def usernames(self) -> List[str]:
+        '''
+        Returns the usernames of the clients, in the order they joined.
+        '''
+        return list(self.by_username)
+
+    def __len__(self) -> int:
+        return len(self.by_username)
+
 
 class Server:
     '''
     This is the main Server Class.
     '''
 
-    def __init__(self, dest: str, port: int, window: str):
+    def __init__(self, dest: str, port: int, window: str,
+                 max_clients: int = util.MAX_NUM_CLIENTS):
         self.server_addr = dest
         self.server_port = port
         self.reliable_sock = ReliableSocket(dest, port, int(window))
-        self.clients = list()
+        self.clients = ClientRegistry()
+        # The number of clients that may be online at once
+        self.max_clients = max_clients
 
     def start(self):
         # This is the main loop of the server that runs infinitely and receives messages from the clients and responds accordingly.
@@ -38,12 +103,22 @@ class Server:
             elif message_parts[0] == "send_file":
                 self.send_file(message_parts, address)
 
+    def send(self, address, message_to_send):
+        # Sends a message to a client, and drops the client if it has lost its connection
+        try:
+            self.reliable_sock.sendto(address, message_to_send)
+        except ConnectionResetError:
+            self.drop(address)
+
+    def drop(self, address):
+        # Removes the client at an address whose receiver forgot the messages sent to it, such as after a restart
+        username = self.clients.username(address)
+        if self.clients.remove(username, address):
+            print("disconnected:", username, "lost its connection")
+
     def send_file(self, message_parts, address):
         # Extracts the username from the list of clients given the address of the client
-        username = str()
-        for client in self.clients:
-            if address == client["address"]:
-                username = client["username"]
+        username = self.clients.username(address)
 
         # Error handling in case the client did not follow the format and specified a non-integer value
         # Sends a err_unknown_message back to the client and the client disconnects
@@ -52,7 +127,7 @@ class Server:
         except:
             message_to_send = util.make_message(
                 msg_type="err_unknown_message", msg_format=2)
-            self.reliable_sock.sendto(address, message_to_send)
+            self.send(address, message_to_send)
             print("disconnected:", username, "sent unknown command")
             return
 
@@ -61,7 +136,7 @@ class Server:
         if len(message_parts) < num_of_users + 4:
             message_to_send = util.make_message(
                 msg_type="err_unknown_message", msg_format=2)
-            self.reliable_sock.sendto(address, message_to_send)
+            self.send(address, message_to_send)
             print("disconnected:", username, "sent unknown command")
             return
 
@@ -70,41 +145,44 @@ class Server:
                                             message="1 " + username + " " + " ".join(message_parts[1 + num_of_users + 1:]))
         print("file:", username)
 
-        # Maintains a list of usernames of users that have already received the file to ensure that each user gets the file at most once
-        sent_to_clients = list()
-        for i in range(0, num_of_users):
-            # To check whether a particular user was online and sent the file
-            sent = False
-            for client in self.clients:
-                if message_parts[2+i] == client["username"] and client["username"] not in sent_to_clients:
-                    self.reliable_sock.sendto(
-                        client["address"], message_to_send)
-                    sent = True
-                    sent_to_clients.append(client["username"])
-            # In case, a specified user is not sent the file
-            if not sent and message_parts[2+i] not in sent_to_clients:
-                print("file:", username, "to non-existent user",
-                      message_parts[2+i])
+        # Maintains a set of usernames of users that have already received the file to ensure that each user gets the file at most once
+        sent_to_clients = set()
+        # The file is sent to all the recipients at the same time
+        pending = list()
+        for recipient in message_parts[2:2 + num_of_users]:
+            if recipient in sent_to_clients:
+                continue
+            recipient_address = self.clients.address(recipient)
+            # In case, a specified user is not online to be sent the file
+            if recipient_address is None:
+                print("file:", username, "to non-existent user", recipient)
+                continue
+            pending.append((recipient, recipient_address, self.reliable_sock.sendto_async(
+                recipient_address, message_to_send)))
+            sent_to_clients.add(recipient)
+
+        # Waits for every recipient to have it before handling the next command
+        for recipient, recipient_address, send in pending:
+            # In case, a recipient lost its connection, the others still get the file
+            try:
+                send.result()
+            except ConnectionResetError:
+                print("file:", username, "to unreachable user", recipient)
+                self.drop(recipient_address)
 
     def disconnect(self, message_parts, address):
         # Extracts the username from the message
         username = message_parts[1]
-        # Make a dictionary of client to remove later from the list of client
-        client = {"username": username, "address": address}
 
-        # Error handling in case the client is already removed and the server does not crash
-        try:
-            self.clients.remove(client)
+        # In case the client is already removed
+        if self.clients.remove(username, address):
             print("disconnected:", username)
-        except:
+        else:
             print(username, "already disconnected")
 
     def send_message(self, message_parts, address):
         # Extracts the username from the list of clients given the address of the client
-        username = str()
-        for client in self.clients:
-            if address == client["address"]:
-                username = client["username"]
+        username = self.clients.username(address)
 
         # Error handling in case the client did not follow the format and specified a non-integer value
         # Sends a err_unknown_message back to the client and the client disconnects
@@ -113,7 +191,7 @@ class Server:
         except:
             message_to_send = util.make_message(
                 msg_type="err_unknown_message", msg_format=2)
-            self.reliable_sock.sendto(address, message_to_send)
+            self.send(address, message_to_send)
             print("disconnected:", username, "sent unknown command")
             return
 
@@ -122,7 +200,7 @@ class Server:
         if len(message_parts) < num_of_users + 3:
             message_to_send = util.make_message(
                 msg_type="err_unknown_message", msg_format=2)
-            self.reliable_sock.sendto(address, message_to_send)
+            self.send(address, message_to_send)
             print("disconnected:", username, "sent unknown command")
             return
 
@@ -131,61 +209,62 @@ class Server:
                                             message="1 " + username + " " + " ".join(message_parts[1 + num_of_users + 1:]))
         print("msg:", username)
 
-        # Maintains a list of usernames of users that have already received the message to ensure that each user gets the message at most once
-        sent_to_clients = list()
-        for i in range(0, num_of_users):
-            # To check whether a particular user was online and sent the message
-            sent = False
-            for client in self.clients:
-                if message_parts[2+i] == client["username"] and client["username"] not in sent_to_clients:
-                    self.reliable_sock.sendto(
-                        client["address"], message_to_send)
-                    sent = True
-                    sent_to_clients.append(client["username"])
-            # In case, a specified user is not sent the message
-            if not sent and message_parts[2+i] not in sent_to_clients:
-                print("msg:", username, "to non-existent user",
-                      message_parts[2+i])
+        # Maintains a set of usernames of users that have already received the message to ensure that each user gets the message at most once
+        sent_to_clients = set()
+        # The message is sent to all the recipients at the same time
+        pending = list()
+        for recipient in message_parts[2:2 + num_of_users]:
+            if recipient in sent_to_clients:
+                continue
+            recipient_address = self.clients.address(recipient)
+            # In case, a specified user is not online to be sent the message
+            if recipient_address is None:
+                print("msg:", username, "to non-existent user", recipient)
+                continue
+            pending.append((recipient, recipient_address, self.reliable_sock.sendto_async(
+                recipient_address, message_to_send)))
+            sent_to_clients.add(recipient)
+
+        # Waits for every recipient to have it before handling the next command
+        for recipient, recipient_address, send in pending:
+            # In case, a recipient lost its connection, the others still get the message
+            try:
+                send.result()
+            except ConnectionResetError:
+                print("msg:", username, "to unreachable user", recipient)
+                self.drop(recipient_address)
 
     def request_users_list(self, address):
         # Extracts the username from the list of clients given the address of the client
-        username = str()
-        for client in self.clients:
-            if address == client["address"]:
-                username = client["username"]
+        username = self.clients.username(address)
 
         # Constructs a string of online usernames from the client list
-        list_of_users = str(len(self.clients))
-        for client in self.clients:
-            list_of_users = list_of_users + " " + client["username"]
+        list_of_users = " ".join([str(len(self.clients))] + self.clients.usernames())
 
         # Makes the packet containing the list of users and sends it to the client who requested it
         message_to_send = util.make_message(
             msg_type="response_users_list", msg_format=3, message=list_of_users)
-        self.reliable_sock.sendto(address, message_to_send)
+        self.send(address, message_to_send)
         print("request_users_list:", username)
 
     def join(self, message_parts, address):
         # Extracts the username from the message received
         username = message_parts[1]
-        # Makes a dictionary of client to add later to the list of clients
-        client = {"username": username, "address": address}
 
         # Send a err_server_full message to the client if server is full
-        if len(self.clients) >= util.MAX_NUM_CLIENTS:
+        if len(self.clients) >= self.max_clients:
             print("disconnected: server full")
             message_to_send = util.make_message(
                 msg_type="err_server_full", msg_format=2)
-            self.reliable_sock.sendto(address, message_to_send)
-        # Sends a err_username_unavailable to the client if the username is already taken
-        elif client in self.clients:
+            self.send(address, message_to_send)
+        # Adds the client to the list of clients, or sends a
+        # err_username_unavailable to the client if the username is already taken
+        elif not self.clients.add(username, address):
             print("disconnected: username not available")
             message_to_send = util.make_message(
                 msg_type="err_username_unavailable", msg_format=2)
-            self.reliable_sock.sendto(address, message_to_send)
-        # Adds the client to the list of clients
+            self.send(address, message_to_send)
         else:
-            self.clients.append(client)
             print("join:", username)
 
 # Do not change this part of code
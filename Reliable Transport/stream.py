@@ -0,0 +1,187 @@
+'''
+This module carries messages that are too large to hold in memory: the sender
+reads them from a file or an iterator as its window opens, and the receiver
+hands them to a StreamReader chunk by chunk.
+'''
+import asyncio
+import codecs
+from collections import deque
+import util
+
+
+def pieces_of(source, size: int):
+    '''
+    Yields the pieces of a stream source: the reads of a file-like object
+    (anything with a read method), or the items of an iterable of str or
+    bytes.
+    '''
+    if hasattr(source, "read"):
+        while True:
+            piece = source.read(size)
+            if not piece:
+                return
+            yield piece
+    else:
+        yield from source
+
+
+def chunked(pieces, size: int):
+    '''
+    Cuts pieces of any length into chunks of size bytes (see
+    util.split_payload), except for the last one. Only about one chunk is
+    held at a time, whatever the length of the pieces.
+    '''
+    parts = []
+    buffered = 0
+    for piece in pieces:
+        if not piece:
+            continue
+        parts.append(piece)
+        buffered += len(piece)
+        # a str of size characters has at least size bytes
+        if buffered < size:
+            continue
+        chunks = util.split_payload(parts[0][:0].join(parts), size)
+        yield from chunks[:-1]
+        parts = [chunks[-1]]
+        buffered = len(parts[0])
+    if buffered:
+        yield from util.split_payload(parts[0][:0].join(parts), size)
+
+
+class StreamReader:
+    '''
+    The receiving end of a stream, returned by AsyncReliableSocket.recv_stream.
+
+    Chunks are read with `await read()` (None once the stream has ended) or
+    `async for chunk in reader`. They are str for a text stream and bytes for
+    a bytes stream, whichever wire format carried them.
+
+    At most limit chunks wait to be read: the receiver advertises the space
+    left in the reader as its receive window, so the sender is held back
+    instead of the stream piling up in memory, and on_read, if set, is
+    called whenever reading frees space.
+    '''
+
+    def __init__(self, raw: bool = False, binary: bool = False,
+                 limit: int = util.STREAM_BUFFER_CHUNKS):
+        self.raw = raw
+        self.limit = limit
+        self.chunks = deque()
+        self.ended = False
+        self.waiter = None
+        self.on_read = None
+        # a text stream in the binary wire format is UTF-8 that may be split in the middle of a character
+        self.decoder = codecs.getincrementaldecoder("utf-8")() \
+            if binary and not raw else None
+
+    def full(self) -> bool:
+        '''
+        Tells whether the receiver should stop taking data for now.
+        '''
+        return len(self.chunks) >= self.limit
+
+    def space(self) -> int:
+        '''
+        Returns the number of chunks that may still wait to be read.
+        '''
+        return max(self.limit - len(self.chunks), 0)
+
+    def feed(self, chunk):
+        '''
+        Adds the next in-order chunk of the stream.
+        '''
+        if self.decoder is not None:
+            chunk = self.decoder.decode(chunk)
+            if not chunk:
+                return
+        elif self.raw:
+            chunk = bytes(chunk)
+        self.chunks.append(chunk)
+        self.wake()
+
+    def end(self):
+        '''
+        Marks the end of the stream.
+        '''
+        if self.decoder is not None:
+            rest = self.decoder.decode(b"", final=True)
+            if rest:
+                self.chunks.append(rest)
+        self.ended = True
+        self.wake()
+
+    def wake(self):
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(None)
+        self.waiter = None
+
+    async def read(self):
+        '''
+        Returns the next chunk of the stream, waiting for it if necessary, or
+        None once every chunk has been read.
+        '''
+        while not self.chunks and not self.ended:
+            self.waiter = asyncio.get_running_loop().create_future()
+            await self.waiter
+        if self.chunks:
+            chunk = self.chunks.popleft()
+            self.freed()
+            return chunk
+        return None
+
+    async def read_available(self):
+        '''
+        Returns all the chunks that have arrived and not been read, waiting
+        for one if necessary. The list is empty once the stream has ended.
+        '''
+        chunk = await self.read()
+        if chunk is None:
+            return []
+        chunks = [chunk]
+        chunks.extend(self.chunks)
+        self.chunks.clear()
+        self.freed()
+        return chunks
+
+    def freed(self):
+        if self.on_read is not None:
+            self.on_read()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        chunk = await self.read()
+        if chunk is None:
+            raise StopAsyncIteration
+        return chunk
+
+
+class BlockingStreamReader:
+    '''
+    The receiving end of a stream, returned by ReliableSocket.recv_stream:
+    a StreamReader read from another thread than the one running its event
+    loop. Chunks are read with read() or by iterating over the reader; they
+    are fetched from the event loop in batches of all the chunks available.
+    '''
+
+    def __init__(self, reader: StreamReader, loop: asyncio.AbstractEventLoop):
+        self.reader = reader
+        self.loop = loop
+        self.chunks = deque()
+
+    def read(self):
+        '''
+        Returns the next chunk of the stream, blocking until it is there, or
+        None once every chunk has been read.
+        '''
+        if not self.chunks:
+            self.chunks.extend(asyncio.run_coroutine_threadsafe(
+                self.reader.read_available(), self.loop).result())
+        if self.chunks:
+            return self.chunks.popleft()
+        return None
+
+    def __iter__(self):
+        return iter(self.read, None)
@@ -0,0 +1,33 @@
+from server import ClientRegistry
+
+class ClientRegistryTest(object):
+    # Joins clients to a ClientRegistry, one of them again from the same
+    # address under a new username, and checks that its old username is
+    # gone from both indexes, and that taken usernames and removals by the
+    # wrong address are turned away.
+    def __init__(self, test_name="ClientRegistry"):
+        self.test_name = test_name
+
+    def run(self):
+        print("Testing %s" % self.test_name)
+        clients = ClientRegistry()
+        a, b, c = ("127.0.0.1", 1), ("127.0.0.1", 2), ("127.0.0.1", 3)
+        checks = [(clients.add("alice", a), True, "alice joined"),
+                  (clients.add("bob", b), True, "bob joined"),
+                  (clients.add("bob", a), False, "a taken username was given away"),
+                  (clients.username(a), "alice", "a turned away join changed the client"),
+                  (clients.add("carol", a), True, "alice joined again as carol"),
+                  (clients.usernames(), ["bob", "carol"], "the old username is still listed"),
+                  (clients.address("alice"), None, "the old username still has an address"),
+                  (clients.username(a), "carol", "the address has the wrong username"),
+                  (clients.add("alice", c), True, "the old username was not freed"),
+                  (clients.remove("carol", b), False, "a client was removed by another address"),
+                  (clients.remove("carol", a), True, "carol was not removed"),
+                  (clients.usernames(), ["bob", "alice"], "the registry was left inconsistent"),
+                  (len(clients), 2, "the registry was miscounted")]
+        for value, expected, error in checks:
+            if value != expected:
+                print("Test Failed! %s: expected %r, got %r" % (error, expected, value))
+                return False
+        print("Test Passed!")
+        return True
@@ -0,0 +1,44 @@
+import random
+from string import ascii_letters
+import time
+from tests import BasicTest
+import util
+
+class DelayedPacketsTest(BasicTest.BasicTest):
+    # Holds packets of every type back for up to 1.2 seconds with the
+    # forwarder's delay(), past a turn of its timer wheel (512 ticks of 1ms),
+    # so that they arrive late and out of order.
+    def set_state(self):
+        self.num_of_clients = 4
+        self.client_stdin = {"client1": 1, "client2":2, "client3":3, "client4": 4}
+        self.input = [  ("client1","list\n"),
+                        ("client1","file 2 client1 client5 test_file2\n") ,
+                     ]
+        self.time_interval = 3
+        self.num_of_acks = 8*2 + 2*2 +  2*2
+        self.max_delay = 1.2 # seconds
+        self.delayed_packets = 0
+        with open("test_file2","w") as f:
+            f.write(''.join(random.choice(ascii_letters) for i in range(10000)))
+        self.last_time = time.time()
+
+    def result(self):
+        if self.delayed_packets == 0:
+            print("Test Failed! No packets were delayed")
+            return False
+        self.result_basic()
+
+    def handle_packet(self):
+        for p,user in self.forwarder.in_queue:
+            if len(p.full_packet) > 1500:
+                self.packet_length_exceeded_limit += 1
+                continue
+            msg_type,a,b,c = util.parse_packet(p.full_packet.decode()[8:])
+            self.packets_processed[msg_type] += 1
+            if random.random() < 0.3:
+                self.delayed_packets += 1
+                self.forwarder.delay(p, user, random.uniform(0, self.max_delay))
+            else:
+                self.forwarder.out_queue.append((p,user))
+        # empty out the in_queue
+        self.forwarder.in_queue = []
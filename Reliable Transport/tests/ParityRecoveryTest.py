@@ -0,0 +1,53 @@
+from fec import ParityEncoder, ParityDecoder
+
+class ParityRecoveryTest(object):
+    # Encodes blocks of chunks of different lengths, in both wire formats,
+    # drops one chunk of the first block, one of the second (a shorter block
+    # ended by flush) and two of the third, and checks that the decoder
+    # rebuilds exactly the first two from the parity packets.
+    def __init__(self, test_name="ParityRecovery"):
+        self.test_name = test_name
+        self.block_size = 4
+
+    def run(self):
+        print("Testing %s" % self.test_name)
+        text = ["abc", "h\u00e9llo", "x", "\u65e5\u672c\u8a9e", "a longer chunk",
+                "y", "z", "\U0001f642", "last", "one"]
+        chunks = {"text": text,
+                  "binary": [chunk.encode("utf-8") for chunk in text[:-1]] + [b"ends in zeros\x00\x00"]}
+        for wire_format, payloads in chunks.items():
+            error = self.check(wire_format == "binary", payloads)
+            if error:
+                print("Test Failed! %s (%s format)" % (error, wire_format))
+                return False
+        print("Test Passed!")
+        return True
+
+    def check(self, binary, payloads):
+        first = 100
+        encoder = ParityEncoder(self.block_size, binary)
+        parities = []
+        for i, payload in enumerate(payloads[:6]):
+            parities.append(encoder.add(first + i, payload))
+        parities.append(encoder.flush())
+        encoder = ParityEncoder(self.block_size, binary)
+        for i, payload in enumerate(payloads[6:]):
+            parities.append(encoder.add(first + 6 + i, payload))
+        parities = [parity for parity in parities if parity is not None]
+        if [(f, l) for f, l, body in parities] != [(100, 103), (104, 105), (106, 109)]:
+            return "Unexpected blocks %s" % [(f, l) for f, l, body in parities]
+
+        lost = {102, 105, 107, 108}
+        decoder = ParityDecoder(self.block_size, binary, first)
+        for i, payload in enumerate(payloads):
+            if first + i not in lost:
+                decoder.add(first + i, payload)
+        for f, l, body in parities:
+            decoder.add_parity(f, body)
+        recovered = sorted(decoder.recover(102))
+        expected = [(102, payloads[2]), (105, payloads[5])]
+        if [(seq_no, bytes(payload) if binary else payload) for seq_no, payload in recovered] != expected:
+            return "Expected %s to be rebuilt, got %s" % (expected, recovered)
+        if decoder.recover(102):
+            return "A block was rebuilt twice"
+        return None
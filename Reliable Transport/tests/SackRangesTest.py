@@ -0,0 +1,38 @@
+from reassembly import ReassemblyBuffer
+
+class SackRangesTest(object):
+    # Feeds a ReassemblyBuffer chunks around holes, and checks the cumulative
+    # ACK and the SACK ranges it reports as the holes are filled.
+    def __init__(self, test_name="SackRanges"):
+        self.test_name = test_name
+
+    def run(self):
+        print("Testing %s" % self.test_name)
+        buffer = ReassemblyBuffer(10)
+        for seq_no in (10, 11, 13, 14, 16, 18, 19, 20):
+            buffer.add(seq_no, "c%d" % seq_no)
+        if buffer.add(14, "c14") or buffer.add(10, "c10"):
+            print("Test Failed! A duplicate chunk was stored")
+            return False
+        expected = [(None, 12, [[13, 15], [16, 17], [18, 21]]),
+                    (12, 15, [[16, 17], [18, 21]]),
+                    (15, 17, [[18, 21]]),
+                    (17, 21, [])]
+        for seq_no, ack, ranges in expected:
+            if seq_no is not None:
+                buffer.add(seq_no, "c%d" % seq_no)
+            if buffer.cumulative_ack() != ack or buffer.sack_ranges() != ranges:
+                print("Test Failed! Expected ACK %d with %s, got %d with %s" % (
+                    ack, ranges, buffer.cumulative_ack(), buffer.sack_ranges()))
+                return False
+        limited = ReassemblyBuffer(0)
+        for seq_no in (2, 4, 6, 8):
+            limited.add(seq_no, "c%d" % seq_no)
+        if limited.sack_ranges(limit=2) != [[2, 3], [4, 5]]:
+            print("Test Failed! The limit on SACK ranges was not kept", limited.sack_ranges(limit=2))
+            return False
+        if buffer.message() != "".join("c%d" % seq_no for seq_no in range(10, 21)):
+            print("Test Failed! The chunks were not reassembled in order")
+            return False
+        print("Test Passed!")
+        return True
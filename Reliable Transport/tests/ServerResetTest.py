@@ -0,0 +1,73 @@
+import contextlib
+import io
+from concurrent.futures import Future
+from server import Server
+
+class ForgetfulSocket(object):
+    # Stands in for the ReliableSocket of the server: the sends to the
+    # forgotten addresses fail the way they do when the receiver there has
+    # lost its state.
+    def __init__(self, forgotten):
+        self.forgotten = forgotten
+        self.sent = []
+
+    def sendto_async(self, address, message):
+        send = Future()
+        if address in self.forgotten:
+            send.set_exception(ConnectionResetError("the receiver forgot the message"))
+        else:
+            self.sent.append(address)
+            send.set_result(None)
+        return send
+
+    def sendto(self, address, message):
+        self.sendto_async(address, message).result()
+
+class ServerResetTest(object):
+    # Sends a message and a file to two clients of a Server, one of which has
+    # lost its connection, and answers a list request from it. The other
+    # client should still get both, the lost one should be dropped, and the
+    # server should keep serving.
+    def __init__(self, test_name="ServerReset"):
+        self.test_name = test_name
+
+    def run(self):
+        print("Testing %s" % self.test_name)
+        server = Server("127.0.0.1", 0, 3)
+        sock = ForgetfulSocket({("127.0.0.1", 2)})
+        server.reliable_sock = sock
+        commands = [("join a", 1), ("join b", 2), ("join c", 3),
+                    ("send_message 2 b c hello", 1),
+                    ("send_file 2 b c file_name contents", 1),
+                    ("request_users_list", 2), ("request_users_list", 1)]
+        log = io.StringIO()
+        try:
+            with contextlib.redirect_stdout(log):
+                for command, port in commands:
+                    self.handle(server, command.split(" "), ("127.0.0.1", port))
+        except ConnectionResetError:
+            print("Test Failed! The server stopped on a lost connection")
+            return False
+        lines = log.getvalue().split("\n")
+        if sock.sent != [("127.0.0.1", 3), ("127.0.0.1", 3), ("127.0.0.1", 1)]:
+            print("Test Failed! The other clients did not get what was sent", sock.sent)
+            return False
+        if "msg: a to unreachable user b" not in lines or \
+                "disconnected: b lost its connection" not in lines:
+            print("Test Failed! The lost connection was not logged")
+            return False
+        if server.clients.usernames() != ["a", "c"]:
+            print("Test Failed! The lost client was not dropped", server.clients.usernames())
+            return False
+        print("Test Passed!")
+        return True
+
+    def handle(self, server, message_parts, address):
+        if message_parts[0] == "join":
+            server.join(message_parts, address)
+        elif message_parts[0] == "send_message":
+            server.send_message(message_parts, address)
+        elif message_parts[0] == "send_file":
+            server.send_file(message_parts, address)
+        elif message_parts[0] == "request_users_list":
+            server.request_users_list(address)
@@ -0,0 +1,41 @@
+import asyncio
+from async_socket import AsyncReliableSocket
+
+class SessionResetTest(object):
+    # Restarts the receiving socket of a session on the same port. The new
+    # socket resets the session, and the messages sent to it after the
+    # restart should still arrive, in a new session.
+    def __init__(self, test_name="SessionReset"):
+        self.test_name = test_name
+        self.timeout = 15. # seconds
+
+    def run(self):
+        print("Testing %s" % self.test_name)
+        try:
+            received = asyncio.run(asyncio.wait_for(self.restart(), self.timeout))
+        except asyncio.TimeoutError:
+            print("Test Failed! The session did not recover from the restart")
+            return False
+        if received != ["before", "after", "after" * 1000]:
+            print("Test Failed! Messages were lost or delivered twice", received)
+            return False
+        print("Test Passed!")
+        return True
+
+    async def restart(self):
+        received = []
+        deliver = lambda message, address: received.append(message)
+        receiver = AsyncReliableSocket("127.0.0.1", 0, 4, sessions=True, on_message=deliver)
+        sender = AsyncReliableSocket("127.0.0.1", 0, 4, sessions=True)
+        address = receiver.getsockname()
+        try:
+            await sender.sendto(address, "before")
+            receiver.close()
+            receiver = AsyncReliableSocket(address[0], address[1], 4, sessions=True,
+                                           on_message=deliver)
+            await sender.sendto(address, "after")
+            await sender.sendto(address, "after" * 1000)
+        finally:
+            sender.close()
+            receiver.close()
+        return received
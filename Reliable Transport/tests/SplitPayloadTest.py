@@ -0,0 +1,40 @@
+import util
+
+class SplitPayloadTest(object):
+    # Splits text with characters of one to four UTF-8 bytes into chunks of
+    # a few sizes, and checks that the chunks join back into the text, fit in
+    # the size once encoded and are never cut in the middle of a character
+    # or left shorter than they had to be.
+    def __init__(self, test_name="SplitPayload"):
+        self.test_name = test_name
+
+    def run(self):
+        print("Testing %s" % self.test_name)
+        texts = ["plain ascii " * 20,
+                 "h\u00e9llo w\u00f6rld " * 20,
+                 "\u65e5\u672c\u8a9e\u306e\u30c6\u30ad\u30b9\u30c8" * 20,
+                 "\U0001f642" * 40,
+                 "a\u00e9\u65e5\U0001f642" * 30]
+        for text in texts:
+            for size in (4, 5, 7, 10, 1000):
+                error = self.check(text, size)
+                if error:
+                    print("Test Failed! %s (size %d, %r...)" % (error, size, text[:10]))
+                    return False
+        if util.split_payload(b"\xe6\x97\xa5\xe6\x9c\xac", 4) != [b"\xe6\x97\xa5\xe6", b"\x9c\xac"]:
+            print("Test Failed! Bytes were not cut every size bytes")
+            return False
+        print("Test Passed!")
+        return True
+
+    def check(self, text, size):
+        chunks = util.split_payload(text, size)
+        if "".join(chunks) != text:
+            return "The chunks do not join back into the text"
+        for i, chunk in enumerate(chunks):
+            encoded = len(chunk.encode("utf-8"))
+            if encoded == 0 or encoded > size:
+                return "A chunk of %d bytes" % encoded
+            if i + 1 < len(chunks) and encoded + len(chunks[i + 1][0].encode("utf-8")) <= size:
+                return "A chunk was cut short"
+        return None
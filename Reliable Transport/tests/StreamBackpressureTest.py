@@ -0,0 +1,46 @@
+import asyncio
+from async_socket import AsyncReliableSocket
+
+class StreamBackpressureTest(object):
+    # Sends a stream to a reader that stops reading until its reader is
+    # full. The closed window should hold the sender back without any data
+    # being turned away, so the sender sees no duplicate ACKs, and the whole
+    # stream should arrive once the reader carries on.
+    def __init__(self, test_name="StreamBackpressure"):
+        self.test_name = test_name
+        self.chunks = 1000
+        self.stall = 1. # seconds
+        self.timeout = 30. # seconds
+
+    def run(self):
+        print("Testing %s" % self.test_name)
+        try:
+            metrics, received = asyncio.run(asyncio.wait_for(self.send(), self.timeout))
+        except asyncio.TimeoutError:
+            print("Test Failed! The stream did not go on after the reader did")
+            return False
+        if metrics.get("duplicate_acks", 0) or metrics.get("fast_retransmits", 0):
+            print("Test Failed! The full reader looked like packet loss", metrics)
+            return False
+        if received != "x" * 1000 * self.chunks:
+            print("Test Failed! The stream was not received whole")
+            return False
+        print("Test Passed!")
+        return True
+
+    async def send(self):
+        receiver = AsyncReliableSocket("127.0.0.1", 0, 64)
+        sender = AsyncReliableSocket("127.0.0.1", 0, 64)
+        address = receiver.getsockname()
+        try:
+            sending = asyncio.ensure_future(sender.send_stream(
+                address, ("x" * 1000 for _ in range(self.chunks))))
+            reader, _ = await receiver.recv_stream()
+            await asyncio.sleep(self.stall)
+            metrics = sender.metrics()[address]
+            received = "".join([chunk async for chunk in reader])
+            await sending
+        finally:
+            sender.close()
+            receiver.close()
+        return metrics, received
@@ -0,0 +1,43 @@
+import asyncio
+import time
+from async_socket import AsyncReliableSocket
+import util
+
+class SustainedSendTest(object):
+    # Sends more messages to one peer than there are message ids, faster than
+    # the finished senders are retired, so that the ids run out while they
+    # linger. Every message should still arrive, once.
+    def __init__(self, test_name="SustainedSend", messages=None):
+        self.test_name = test_name
+        if messages is None:
+            messages = (util.MAX_MSG_ID - util.MIN_MSG_ID + 1) * 6 // 5
+        self.messages = messages
+        self.timeout = 180. # seconds
+
+    def run(self):
+        print("Testing %s" % self.test_name)
+        start = time.time()
+        try:
+            received = asyncio.run(asyncio.wait_for(self.send_all(), self.timeout))
+        except asyncio.TimeoutError:
+            print("Test Failed! Sends stopped going through after %d seconds" % (time.time() - start))
+            return False
+        if sorted(received) != sorted("m%d" % i for i in range(self.messages)):
+            print("Test Failed! Messages were lost or delivered twice")
+            return False
+        print("Test Passed!")
+        return True
+
+    async def send_all(self):
+        received = []
+        receiver = AsyncReliableSocket("127.0.0.1", 0, 8,
+                                       on_message=lambda message, address: received.append(message))
+        sender = AsyncReliableSocket("127.0.0.1", 0, 8)
+        try:
+            address = receiver.getsockname()
+            await asyncio.gather(*(sender.sendto(address, "m%d" % i)
+                                   for i in range(self.messages)))
+        finally:
+            sender.close()
+            receiver.close()
+        return received
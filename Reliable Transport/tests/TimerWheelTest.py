@@ -0,0 +1,36 @@
+class TimerWheelTest(object):
+    # Schedules items on a small wheel of the forwarder's TimerWheel class,
+    # some of them a turn or more ahead, in the same slot as nearer ones, and
+    # checks that each comes out when its own tick has passed and not before.
+    def __init__(self, wheel_class, test_name="TimerWheel"):
+        self.wheel_class = wheel_class
+        self.test_name = test_name
+
+    def run(self):
+        print("Testing %s" % self.test_name)
+        wheel = self.wheel_class(1, slots=8)
+        now = wheel.current
+        wheel.schedule(now + 0.5, "next tick")
+        wheel.schedule(now + 3, "three")
+        wheel.schedule(now + 3, "three again")
+        wheel.schedule(now + 11, "a turn after three")
+        wheel.schedule(now + 20, "two turns ahead")
+        wheel.schedule(now - 5, "overdue")
+        expected = [(now, ["overdue"]),
+                    (now + 1, ["next tick"]),
+                    (now + 2, []),
+                    (now + 3, ["three", "three again"]),
+                    (now + 10, []),
+                    (now + 11, ["a turn after three"]),
+                    (now + 19, []),
+                    (now + 100, ["two turns ahead"])]
+        for at, items in expected:
+            ready = wheel.expire(at)
+            if sorted(ready) != sorted(items):
+                print("Test Failed! At tick %d expected %s, got %s" % (at - now, items, ready))
+                return False
+        if wheel.count != 0:
+            print("Test Failed! %d items were left on the wheel" % wheel.count)
+            return False
+        print("Test Passed!")
+        return True
@@ -1,31 +1,49 @@
 '''
 This file contains basic utility functions that you can use.
 '''
-import binascii
+import checksum
 
 MAX_NUM_CLIENTS = 10
-TIME_OUT = 0.5  # 500ms
+TIME_OUT = 0.5  # 500ms, initial retransmission timeout
+MIN_TIME_OUT = 0.005  # 5ms, lower bound of the adaptive timeout
+MAX_TIME_OUT = 8  # 8s, upper bound of the backed off timeout
 NUM_OF_RETRANSMISSIONS = 3
-CHUNK_SIZE = 1400  # 1400 Bytes
+CHUNK_SIZE = 1400  # 1400 Bytes, read from a stream at a time
+MAX_DATAGRAM_SIZE = 1472  # 1500 Bytes of Ethernet MTU minus the IPv4 and UDP headers
+IO_BATCH_SIZE = 64  # datagrams read from a socket per wakeup of the event loop
+MAX_SACK_BLOCKS = 8  # SACK ranges reported per ACK
+INITIAL_CWND = 4  # packets in flight before the first ACK
+DUP_ACK_THRESHOLD = 3  # duplicate ACKs that trigger a fast retransmit
+PACING_BURST = 16  # datagrams a pacer lets out back to back
+PACING_GAIN = 1.25  # windows per round trip time a pacer spreads packets at
+ACK_EVERY = 2  # in-order data packets per ACK, with delayed ACKs
+MAX_IN_FLIGHT_MESSAGES = 64  # messages a socket sends at the same time
+MIN_MSG_ID = 50000  # the message ids of a peer's messages are taken in turn from
+MAX_MSG_ID = 99999  # MIN_MSG_ID to MAX_MSG_ID, skipping the ones still in use
+LINGER_TIME = 2 * MAX_TIME_OUT  # 16s, a finished message is kept for late duplicates
+IDLE_TIME_OUT = 60  # 60s without packets before an unfinished message is dropped
+SESSION_IDLE_TIME = 20  # 20s without messages before a session is closed
+STREAM_BUFFER_CHUNKS = 64  # chunks of a stream received but not read yet
+COMPRESSION_THRESHOLD = 1024  # 1KB, smaller messages are not worth compressing
+METRICS_INTERVAL = 10  # 10s between two dumps of the metrics of a socket to its file
 
 
 def validate_checksum(message):
     '''
     Validates Checksum of a message and returns true/false
     '''
-    try:
-        msg, checksum = message.rsplit('|', 1)
-        msg += '|'
-        return generate_checksum(msg.encode()) == checksum
-    except BaseException:
-        return False
+    if isinstance(message, str):
+        message = message.encode()
+    return checksum.validate_text(bytes(message))
 
 
 def generate_checksum(message):
     '''
-    Returns Checksum of the given message
+    Returns Checksum of the given message (str or bytes-like)
     '''
-    return str(binascii.crc32(message) & 0xffffffff)
+    if isinstance(message, str):
+        message = message.encode()
+    return checksum.text_checksum(message).decode()
 
 
 def make_packet(pck_type="data", seqno=0, msg=""):
@@ -53,6 +71,77 @@ def parse_packet(packet):
     return pck_type, seqno, data, checksum
 
 
+def split_payload(data, size):
+    '''
+    Splits data into chunks of at most size bytes. A str is measured in UTF-8
+    and never cut in the middle of a character; bytes-like data is cut every
+    size bytes.
+    '''
+    if not isinstance(data, str) or data.isascii():
+        return [data[i:i+size] for i in range(0, len(data), size)]
+
+    encoded = data.encode("utf-8")
+    chunks = []
+    start = 0
+    while start < len(encoded):
+        end = min(start + size, len(encoded))
+        # back off to the first byte of the character at the cut
+        while end < len(encoded) and encoded[end] & 0xC0 == 0x80:
+            end -= 1
+        chunks.append(encoded[start:end].decode("utf-8"))
+        start = end
+    return chunks
+
+
+def make_options(options):
+    '''
+    Encodes a dict of options as the body of a start or ack packet.
+    The format is `<key>=<value>;<key>=<value>`, a key mapped to True is sent
+    on its own and keys mapped to None or False are left out.
+    '''
+    fields = []
+    for key, value in options.items():
+        if value is True:
+            fields.append(key)
+        elif value is not None and value is not False:
+            fields.append("%s=%s" % (key, value))
+    return ";".join(fields)
+
+
+def parse_options(body):
+    '''
+    Parses the body of a start or ack packet made with make_options into a dict.
+    Keys sent on their own are mapped to True.
+    '''
+    options = {}
+    for field in body.split(";"):
+        if not field:
+            continue
+        key, sep, value = field.partition("=")
+        options[key] = value if sep else True
+    return options
+
+
+def make_ranges(ranges):
+    '''
+    Encodes a list of half-open sequence number ranges [first, last) as
+    `<first>-<last>,<first>-<last>`.
+    '''
+    return ",".join("%d-%d" % (first, last) for first, last in ranges)
+
+
+def parse_ranges(value):
+    '''
+    Parses ranges made with make_ranges into a list of (first, last) tuples.
+    '''
+    ranges = []
+    for field in value.split(","):
+        if field:
+            first, last = field.split("-")
+            ranges.append((int(first), int(last)))
+    return ranges
+
+
 def make_message(msg_type, msg_format, message=None):
     '''
     This function can be used to format your message according